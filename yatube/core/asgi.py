@@ -0,0 +1,210 @@
+"""Минимальный ASGI без сторонних пакетов: маршрутизация и запуск WSGI.
+
+Django 2.2 не умеет ASGI, а брокер событий posts.events живет в памяти
+процесса. Поэтому весь сайт работает в одном ASGI-процессе: адреса
+событий обслуживают асинхронные обработчики, остальное - обычное
+WSGI-приложение Django в пуле потоков.
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+
+from .uploads import get_body_max_size
+
+# Сколько потоков выполняют обычные запросы Django
+WSGI_WORKERS: int = 8
+
+
+class BodyTooLarge(Exception):
+    """Тело запроса больше get_body_max_size()"""
+
+
+async def read_body(scope, receive):
+    """Тело запроса во временном файле, в памяти держится только небольшое.
+
+    Слишком большое тело не читается: по Content-Length отказ сразу,
+    без него - как только пришло больше допустимого.
+    """
+    max_size = get_body_max_size()
+    length = dict(scope.get('headers', [])).get(b'content-length', b'')
+    if length.isdigit() and int(length) > max_size:
+        raise BodyTooLarge
+    body = SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    size = 0
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > max_size:
+                raise BodyTooLarge
+            body.write(chunk)
+            if not message.get('more_body'):
+                break
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def send_response(send, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def wsgi_environ(scope, body):
+    """environ WSGI-запроса по scope ASGI, body - файл с телом"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # В WSGI путь - это байты запроса, прочитанные как latin-1
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = f'{environ[key]},{value}'
+        environ[key] = value
+    return environ
+
+
+class WsgiApplication:
+    """ASGI-обертка WSGI-приложения: запрос и каждый кусок ответа
+    выполняются в пуле потоков, потоковые ответы не копятся в памяти.
+    """
+    _end = object()
+
+    def __init__(self, application, workers=WSGI_WORKERS):
+        self.application = application
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='wsgi'
+        )
+
+    def start(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+
+        body = self.application(environ, start_response)
+        return response['status'], response['headers'], body
+
+    def next_chunk(self, iterator):
+        return next(iterator, self._end)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            body = await read_body(scope, receive)
+        except BodyTooLarge:
+            await send_response(
+                send, 413, [('Content-Type', 'text/plain; charset=utf-8')],
+                'Слишком большой запрос'.encode(),
+            )
+            return
+        with body:
+            await self.respond(scope, send, body)
+
+    async def respond(self, scope, send, body):
+        loop = asyncio.get_event_loop()
+        status, headers, chunks = await loop.run_in_executor(
+            self.executor, self.start, wsgi_environ(scope, body)
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (name.encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ],
+        })
+        iterator = iter(chunks)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(
+                    self.executor, self.next_chunk, iterator
+                )
+                if chunk is self._end:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # close() у ответа Django шлет request_finished,
+            # как после обычного WSGI-запроса
+            if hasattr(chunks, 'close'):
+                await loop.run_in_executor(self.executor, chunks.close)
+
+
+class Router:
+    """GET на адреса из routes - в их обработчики, остальное - в default"""
+
+    def __init__(self, routes, default):
+        self.routes = routes
+        self.default = default
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = self.routes.get(scope['path'])
+        if handler is None or scope['method'] != 'GET':
+            handler = self.default
+        await handler(scope, receive, send)
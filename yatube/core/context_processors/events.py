@@ -0,0 +1,9 @@
+from posts import events as posts_events
+
+
+def events(request):
+    """Как страницы узнают о новых постах: поток событий или опрос"""
+    return {
+        'events_streaming': posts_events.streaming(),
+        'events_poll_interval': posts_events.poll_interval(),
+    }
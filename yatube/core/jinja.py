@@ -0,0 +1,54 @@
+"""Окружение Jinja2 для шаблонов из каталогов <app>/jinja2.
+
+Дает шаблонам то, что в языке Django подключается через {% load %}:
+static, url, thumbnail и post_cards глобальными функциями, фильтр
+addclass и фильтры дат и обрезки текста.
+"""
+import logging
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template import defaultfilters
+from django.urls import reverse
+from jinja2 import Environment, Undefined
+from sorl.thumbnail import get_thumbnail
+
+from core.templatetags.user_filters import addclass
+from posts.templatetags.post_cards import post_cards
+
+logger = logging.getLogger(__name__)
+
+
+def url(viewname, *args, **kwargs):
+    return reverse(viewname, args=args, kwargs=kwargs)
+
+
+def thumbnail(file, geometry, **options):
+    """Миниатюра как в {% thumbnail %}: None без картинки и при ошибке"""
+    if not file:
+        return None
+    try:
+        return get_thumbnail(file, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', file)
+        return None
+
+
+def environment(**options):
+    # Как в шаблонах Django: неизвестная переменная - пустая строка
+    # и в DEBUG, а перевод строки в конце файла сохраняется
+    options['undefined'] = Undefined
+    options.setdefault('keep_trailing_newline', True)
+    env = Environment(**options)
+    env.globals.update({
+        'static': staticfiles_storage.url,
+        'url': url,
+        'thumbnail': thumbnail,
+        'post_cards': post_cards,
+    })
+    env.filters.update({
+        'addclass': addclass,
+        'date': defaultfilters.date,
+        'truncatechars': defaultfilters.truncatechars,
+        'truncatewords': defaultfilters.truncatewords,
+    })
+    return env
@@ -0,0 +1,173 @@
+import json
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.management.commands.sync_replicas import copy_database
+from core.sqlite import apply_pragmas, get_pragmas, is_locked
+
+# Настройки SQLite по умолчанию, с которыми работал проект раньше
+BASELINE_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+}
+
+READ_SQL = (
+    'SELECT p.id, p.text, p.pub_date, u.username FROM posts_post p '
+    'JOIN auth_user u ON u.id = p.author_id '
+    'ORDER BY p.pub_date DESC, p.id DESC LIMIT 10 OFFSET ?'
+)
+WRITE_SQL = (
+    'INSERT INTO posts_comment (post_id, author_id, text, created) '
+    "VALUES (?, ?, ?, datetime('now'))"
+)
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite для параллельных '
+            'читателей и писателей с настройками по умолчанию и с '
+            'PRAGMA из core.sqlite. Работает с копией основной базы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument(
+            '--timeout', type=float, default=5,
+            help='Ожидание блокировки sqlite3 в секундах'
+        )
+        parser.add_argument('--output', help='Файл для результата')
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        if database.vendor != 'sqlite':
+            raise CommandError('Команда замеряет только SQLite')
+        self.options = options
+        with tempfile.TemporaryDirectory() as directory:
+            report = {
+                'meta': {
+                    'seconds': options['seconds'],
+                    'writers': options['writers'],
+                    'readers': options['readers'],
+                    'sqlite': sqlite3.sqlite_version,
+                },
+                'results': {},
+            }
+            for name, pragmas in (('baseline', BASELINE_PRAGMAS),
+                                  ('tuned', get_pragmas())):
+                path = os.path.join(directory, f'{name}.sqlite3')
+                copy_database(database.settings_dict['NAME'], path)
+                report['results'][name] = self.run(path, pragmas)
+                self.stderr.write(f'{name}: {report["results"][name]}')
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def connect(self, path, pragmas):
+        connection = sqlite3.connect(
+            path, timeout=self.options['timeout'], isolation_level=None
+        )
+        apply_pragmas(connection.cursor(), pragmas)
+        return connection
+
+    def sample(self, path, pragmas):
+        """id постов и пользователей для записи и число постов"""
+        connection = self.connect(path, pragmas)
+        try:
+            self.post_ids = [row[0] for row in connection.execute(
+                'SELECT id FROM posts_post ORDER BY id LIMIT 1000'
+            )]
+            self.user_ids = [row[0] for row in connection.execute(
+                'SELECT id FROM auth_user ORDER BY id LIMIT 1000'
+            )]
+            self.total = connection.execute(
+                'SELECT COUNT(*) FROM posts_post'
+            ).fetchone()[0]
+        finally:
+            connection.close()
+        if not self.post_ids or not self.user_ids:
+            raise CommandError(
+                'В базе нет постов, заполните ее командой seed_yatube'
+            )
+
+    def operation(self, connection, kind):
+        if kind == 'read':
+            connection.execute(
+                READ_SQL, (random.randrange(self.total),)
+            ).fetchall()
+            return
+        connection.execute('BEGIN')
+        connection.execute(WRITE_SQL, (
+            random.choice(self.post_ids),
+            random.choice(self.user_ids),
+            'Комментарий для замера',
+        ))
+        connection.execute('COMMIT')
+
+    def work(self, kind, path, pragmas, deadline):
+        connection = self.connect(path, pragmas)
+        durations = []
+        locked = 0
+        try:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    self.operation(connection, kind)
+                except sqlite3.OperationalError as error:
+                    if not is_locked(error):
+                        raise
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    locked += 1
+                    continue
+                durations.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+        with self.lock:
+            self.stats[kind].extend(durations)
+            self.stats['locked'] += locked
+
+    def run(self, path, pragmas):
+        self.sample(path, pragmas)
+        self.stats = {'write': [], 'read': [], 'locked': 0}
+        self.lock = threading.Lock()
+        deadline = time.monotonic() + self.options['seconds']
+        kinds = (['write'] * self.options['writers']
+                 + ['read'] * self.options['readers'])
+        threads = [
+            threading.Thread(
+                target=self.work, args=(kind, path, pragmas, deadline)
+            )
+            for kind in kinds
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = self.options['seconds']
+        result = {'locked_errors': self.stats['locked']}
+        for kind in ('write', 'read'):
+            p99 = percentile(self.stats[kind], 99)
+            result[f'{kind}s_per_s'] = round(
+                len(self.stats[kind]) / seconds, 1
+            )
+            result[f'{kind}_p99_ms'] = p99 and round(p99 * 1000, 2)
+        return result
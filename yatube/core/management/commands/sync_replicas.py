@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import get_replicas
+
+
+def copy_database(source, target):
+    """Согласованная копия файла SQLite через backup API.
+
+    Копирование не блокирует запись в основную базу надолго и
+    безопасно при параллельных запросах к ней.
+    """
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        source_connection.backup(target_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплики - замена репликации '
+            'для локальной проверки чтения с реплик')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять копирование раз в столько секунд'
+        )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError(
+                'Реплики не настроены, задайте YATUBE_DB_REPLICAS'
+            )
+        for alias in (DEFAULT_DB_ALIAS, *replicas):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(
+                    f'{alias}: копированием синхронизируется только SQLite'
+                )
+        while True:
+            for alias in replicas:
+                connections[alias].close()
+                copy_database(
+                    primary['NAME'], connections[alias].settings_dict['NAME']
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Реплики синхронизированы: {", ".join(replicas)}'
+            ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
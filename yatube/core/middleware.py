@@ -0,0 +1,296 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions import middleware as session_middleware
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import (MiddlewareNotUsed,
+                                    SuspiciousFileOperation)
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import compression, routers
+from .queries import QueryBudgetExceeded, QueryRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCountMiddleware:
+    """Считает запросы к базе за время обработки запроса.
+
+    При превышении бюджета вьюхи пишет предупреждение в лог, а при
+    QUERY_BUDGET_STRICT (в DEBUG и в тестах) выбрасывает исключение.
+    При QUERY_COUNT_HEADERS добавляет статистику в заголовки ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        duplicates = recorder.duplicates
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and len(recorder) > budget:
+            message = (
+                f'Бюджет запросов превышен: {request.path} выполнил '
+                f'{len(recorder)} из {budget}, повторы: {duplicates}'
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', settings.DEBUG):
+                raise QueryBudgetExceeded(
+                    message + '\n' + '\n'.join(
+                        sql for sql, _ in recorder.queries
+                    )
+                )
+            logger.warning(message)
+        if getattr(settings, 'QUERY_COUNT_HEADERS', settings.DEBUG):
+            response['X-Query-Count'] = str(len(recorder))
+            response['X-Query-Duplicates'] = str(
+                sum(count - 1 for count in duplicates.values())
+            )
+            response['X-DB-Time'] = f'{recorder.duration * 1000:.1f}ms'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+
+class ReplicaMiddleware:
+    """Разрешает безопасным запросам читать с реплик базы.
+
+    После записи ставит куку, и следующие REPLICA_STICKY_SECONDS секунд
+    запросы этого клиента читают основную базу.
+    """
+    cookie_name = 'primary_db'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in ('GET', 'HEAD')
+        if safe and self.cookie_name not in request.COOKIES:
+            routing = routers.use_replicas()
+        else:
+            routing = routers.use_primary()
+        with routing:
+            response = self.get_response(request)
+            wrote = routers.wrote()
+        if routers.get_replicas() and (wrote or not safe):
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+            # Ответ с кукой не должен попасть в общий кеш
+            patch_cache_control(response, private=True)
+        return response
+
+
+def is_anonymous_read(request):
+    """Чтение без куки сессии: пользователь заведомо анонимный"""
+    return (request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES)
+
+
+class SessionMiddleware(session_middleware.SessionMiddleware):
+    """Сессия без обращений к хранилищу для анонимных читателей.
+
+    Если за время запроса в сессию ничего не записали, ответ уходит без
+    куки и с Cache-Control: public, чтобы его могли кешировать прокси.
+    Vary: Cookie остается: вошедшим пользователям та же страница
+    отдается по-другому.
+    """
+
+    def process_request(self, request):
+        request.anonymous_read = is_anonymous_read(request)
+        super().process_request(request)
+
+    def process_response(self, request, response):
+        if (not getattr(request, 'anonymous_read', False)
+                or request.session.modified):
+            return super().process_response(request, response)
+        patch_vary_headers(response, ('Cookie',))
+        if (response.status_code in (200, 304) and not response.cookies
+                and not response.has_header('Cache-Control')):
+            patch_cache_control(
+                response, public=True,
+                max_age=getattr(settings, 'ANONYMOUS_CACHE_SECONDS', 0),
+            )
+        return response
+
+
+class AuthenticationMiddleware(auth_middleware.AuthenticationMiddleware):
+    """Анонимным читателям пользователь назначается без чтения сессии"""
+
+    def process_request(self, request):
+        if getattr(request, 'anonymous_read', False):
+            request.user = AnonymousUser()
+            return
+        super().process_request(request)
+
+
+class PrecompressedStaticMiddleware:
+    """Отдает собранную статику из STATIC_ROOT без вызова вьюх.
+
+    Если клиент принимает br или gzip и collectstatic создал сжатую
+    копию, отдается она. Файлы с хешем в имени кешируются навсегда
+    (immutable), остальные - на STATIC_MAX_AGE секунд.
+    """
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STATIC_PRECOMPRESSED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self.hashed = set(
+            getattr(staticfiles_storage, 'hashed_files', {}).values()
+        )
+
+    def __call__(self, request):
+        if (request.method in ('GET', 'HEAD')
+                and request.path_info.startswith(self.prefix)):
+            response = self.serve(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def find(self, name, request):
+        """Путь к файлу и кодировка лучшей доступной копии"""
+        path = safe_join(self.root, name)
+        if not os.path.isfile(path):
+            return None, None
+        # Сжатые копии уже лежат на диске, brotli для них не нужен
+        extensions = {
+            encoding: extension for encoding, extension in self.encodings
+            if os.path.isfile(path + extension)
+        }
+        encoding = compression.negotiate(
+            request.META.get('HTTP_ACCEPT_ENCODING'), list(extensions)
+        )
+        if encoding is None:
+            return path, None
+        return path + extensions[encoding], encoding
+
+    def serve(self, request):
+        name = posixpath.normpath(request.path_info[len(self.prefix):])
+        try:
+            path, encoding = self.find(name.lstrip('/'), request)
+        except SuspiciousFileOperation:
+            return None
+        if path is None:
+            return None
+        stat = os.stat(path)
+        if not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            stat.st_mtime, stat.st_size,
+        ):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(name)
+            response = FileResponse(
+                open(path, 'rb'),
+                content_type=content_type or 'application/octet-stream',
+            )
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if name in self.hashed:
+            patch_cache_control(
+                response, public=True, max_age=60 * 60 * 24 * 365,
+                immutable=True,
+            )
+        else:
+            patch_cache_control(
+                response, public=True,
+                max_age=getattr(settings, 'STATIC_MAX_AGE', 60),
+            )
+        return response
+
+
+class CompressionMiddleware:
+    """Сжимает текстовые ответы brotli или gzip.
+
+    Ответы меньше COMPRESSION_MIN_SIZE, уже сжатые (статика, картинки,
+    миниатюры из MEDIA_URL) и с Cache-Control: no-transform не трогает.
+    Потоковые ответы сжимаются по кускам. Сжатое тело ответа с ETag
+    кешируется: пока страница не изменилась, повторно она не сжимается.
+    """
+    compressible_types = (
+        'text/', 'application/json', 'application/javascript',
+        'application/x-ndjson', 'application/xml', 'image/svg+xml',
+    )
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.compressible(request, response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.negotiate(
+            request.META.get('HTTP_ACCEPT_ENCODING')
+        )
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content, encoding
+            )
+            del response['Content-Length']
+        else:
+            body = self.compressed_body(request, response, encoding)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response['Content-Length'] = str(len(body))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # Тело изменилось, сильный валидатор становится слабым
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def compressible(self, request, response):
+        if (response.has_header('Content-Encoding')
+                or request.path_info.startswith(settings.MEDIA_URL)
+                or 'no-transform' in response.get('Cache-Control', '')):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if not content_type.strip().lower().startswith(
+            self.compressible_types
+        ):
+            return False
+        return response.streaming or len(response.content) >= getattr(
+            settings, 'COMPRESSION_MIN_SIZE', 1024
+        )
+
+    def compressed_body(self, request, response, encoding):
+        etag = response.get('ETag')
+        # Тело с CSRF-токеном уникально для запроса, кешировать нельзя
+        if not etag or request.META.get('CSRF_COOKIE_USED'):
+            return compression.compress(response.content, encoding)
+        digest = hashlib.md5(
+            f'{encoding}:{request.get_full_path()}:{etag}'.encode()
+        ).hexdigest()
+        key = f'compressed:{digest}'
+        body = cache.get(key)
+        if body is None:
+            body = compression.compress(response.content, encoding)
+            cache.set(
+                key, body,
+                getattr(settings, 'COMPRESSION_CACHE_TIMEOUT', 60 * 10),
+            )
+        return body
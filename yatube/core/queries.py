@@ -0,0 +1,83 @@
+"""Учет запросов к базе: количество, повторы и время.
+
+QueryRecorder подключается ко всем соединениям через execute_wrapper,
+поэтому работает и без DEBUG. Бюджет вьюхи задается декоратором
+query_budget и проверяется мидлварью и тестовым миксином.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+# Точки сохранения вложенных atomic: в тестах все вложено в транзакцию
+# TestCase, и без этого бюджеты там отличались бы от боевых
+_SAVEPOINT = re.compile(r'(?:RELEASE |ROLLBACK TO )?SAVEPOINT ', re.I)
+
+
+def fingerprint(sql):
+    """Текст запроса без значений: одинаковые запросы дают один отпечаток"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('(...)', sql)
+
+
+class QueryBudgetExceeded(Exception):
+    """Вьюха выполнила больше запросов, чем объявлено в query_budget"""
+
+
+def query_budget(limit):
+    """Объявить максимальное число запросов для вьюхи.
+
+    Бюджет - худший случай: пустые кеши, вошедший пользователь,
+    старая ссылка ?page=N с COUNT(*) и картинки в ленте.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class QueryRecorder:
+    """Контекстный менеджер, записывающий все запросы к базе"""
+
+    def __init__(self, using=None):
+        self.aliases = [using] if using else list(connections)
+        self.queries = []
+        self.duration = 0.0
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in self.aliases:
+            self._stack.enter_context(
+                connections[alias].execute_wrapper(self)
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        if _SAVEPOINT.match(sql):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.duration += elapsed
+            self.queries.append((sql, elapsed))
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def duplicates(self):
+        """Отпечатки запросов, выполненных больше одного раза"""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
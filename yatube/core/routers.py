@@ -0,0 +1,83 @@
+"""Чтение с реплик базы и запись в основную базу.
+
+Реплики - алиасы из settings.DATABASE_REPLICAS. Читать с них можно
+только внутри use_replicas(): мидлварь ReplicaMiddleware включает это
+для безопасных запросов (GET, HEAD). Везде, где чтение не разрешено
+явно - в командах, потоках и POST-запросах - все идет в основную базу.
+
+Чтобы пользователь видел свои изменения, после записи его запросы
+читают основную базу еще REPLICA_STICKY_SECONDS секунд: мидлварь
+ставит для этого куку. Внутри запроса после первой записи чтение тоже
+переключается на основную базу.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Приложения, которые всегда читают основную базу. Сессии: если новая
+# сессия еще не доехала до реплики, SessionMiddleware удалит куку и
+# пользователь окажется разлогинен
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_replicas_allowed = ContextVar('replicas_allowed', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+@contextmanager
+def _routing(allow_replicas):
+    allowed = _replicas_allowed.set(allow_replicas)
+    wrote = _wrote.set(False)
+    try:
+        yield
+    finally:
+        inner_wrote = _wrote.get()
+        _wrote.reset(wrote)
+        _replicas_allowed.reset(allowed)
+        # Запись во вложенном контексте видна и внешнему
+        if inner_wrote:
+            _wrote.set(True)
+
+
+def use_replicas():
+    """Разрешить чтение с реплик в этом контексте"""
+    return _routing(True)
+
+
+def use_primary():
+    """Читать только основную базу в этом контексте"""
+    return _routing(False)
+
+
+def wrote():
+    """Была ли запись в основную базу в текущем контексте"""
+    return _wrote.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if (not replicas or not _replicas_allowed.get() or _wrote.get()
+                or model._meta.app_label in PRIMARY_ONLY_APPS):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными основной базы
+        return db not in get_replicas()
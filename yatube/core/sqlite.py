@@ -0,0 +1,82 @@
+"""Настройка SQLite для боевой нагрузки.
+
+С журналом WAL читатели не блокируются пишущим, а busy_timeout
+заставляет писателя подождать блокировку вместо немедленной ошибки.
+Остающиеся "database is locked" (например, при повышении блокировки
+внутри транзакции) обрабатывает retry_on_locked.
+"""
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, только последние
+    # транзакции при отключении питания
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер в килобайтах
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+
+def get_pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, get_pragmas())
+
+
+def is_locked(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_locked(attempts=5, delay=0.05, max_delay=1.0):
+    """Повторить функцию в новой транзакции, если база занята.
+
+    Каждая попытка выполняется в transaction.atomic, поэтому частично
+    выполненная запись откатывается. Задержка растет вдвое со случайным
+    разбросом, чтобы писатели не просыпались одновременно. Внутри
+    внешней транзакции повтор бесполезен, и ошибка пробрасывается сразу.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, attempts + 1):
+                try:
+                    with transaction.atomic():
+                        return func(*args, **kwargs)
+                except OperationalError as error:
+                    if (not is_locked(error) or attempt == attempts
+                            or connection.in_atomic_block):
+                        raise
+                    pause = min(delay * 2 ** (attempt - 1), max_delay)
+                    logger.warning(
+                        'База занята, попытка %d из %d через %.3f с',
+                        attempt, attempts, pause,
+                    )
+                    time.sleep(pause * random.uniform(0.5, 1.5))
+        return wrapper
+    return decorator
@@ -0,0 +1,48 @@
+from unittest import mock
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import transaction
+from django.test.runner import DiscoverRunner
+from django.urls import resolve
+
+from .queries import QueryRecorder
+
+
+def run_on_commit():
+    """TestCase не коммитит транзакцию, поэтому on_commit - сразу"""
+    return mock.patch.object(
+        transaction, 'on_commit', side_effect=lambda func: func()
+    )
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов, в котором превышение бюджета запросов - ошибка.
+
+    DiscoverRunner выключает DEBUG, поэтому строгий режим
+    QueryCountMiddleware включается здесь явно.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_STRICT = True
+
+
+class QueryBudgetMixin:
+    """Миксин для TestCase: проверка бюджета запросов вьюхи"""
+
+    def assertWithinQueryBudget(self, client, url):
+        view = resolve(urlparse(url).path).func
+        budget = getattr(view, 'query_budget', None)
+        self.assertIsNotNone(
+            budget, f'Для {view.__name__} не объявлен бюджет запросов'
+        )
+        with QueryRecorder() as recorder:
+            response = client.get(url)
+        self.assertLessEqual(
+            len(recorder),
+            budget,
+            f'{url}: {len(recorder)} запросов при бюджете {budget}\n'
+            + '\n'.join(sql for sql, _ in recorder.queries),
+        )
+        return response
@@ -1,6 +1,34 @@
+import asyncio
+import gzip
+import os
+import sqlite3
+import tempfile
+from datetime import date
 from http import HTTPStatus
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders import cached
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.test import override_settings
+from django.urls import reverse
+from posts.models import Post
+
+from . import asgi, compression, routers, sqlite
+from .management.commands.sync_replicas import copy_database
+from .middleware import (CompressionMiddleware, QueryCountMiddleware,
+                         ReplicaMiddleware)
+from .queries import QueryBudgetExceeded, fingerprint
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +36,465 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class QueryCountTests(TestCase):
+    def test_fingerprint_ignores_values(self):
+        """Запросы с разными значениями дают одинаковый отпечаток"""
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 1 AND s = 'a'"),
+            fingerprint("SELECT * FROM t WHERE id = 25 AND s = 'b''c'"),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+        )
+
+    @override_settings(QUERY_COUNT_HEADERS=True)
+    def test_query_count_headers(self):
+        """Мидлварь добавляет статистику запросов в заголовки"""
+        response = self.client.get('/')
+        self.assertIn('X-Query-Count', response)
+        self.assertIn('X-DB-Time', response)
+        self.assertIn('X-Query-Duplicates', response)
+
+    def test_budget_overrun_raises_in_strict_mode(self):
+        """Превышение бюджета - ошибка в строгом режиме и лог без него"""
+        def view(request):
+            list(Post.objects.all())
+            list(Post.objects.all())
+            return HttpResponse()
+
+        middleware = QueryCountMiddleware(view)
+        request = RequestFactory().get('/')
+        request.query_budget = 1
+        with self.assertRaises(QueryBudgetExceeded):
+            middleware(request)
+        with override_settings(QUERY_BUDGET_STRICT=False):
+            with self.assertLogs('core.middleware', 'WARNING'):
+                middleware(request)
+
+
+@override_settings(ANONYMOUS_CACHE_SECONDS=30)
+class AnonymousReadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = get_user_model().objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Пост для прокси', author=cls.user)
+
+    def test_anonymous_page_is_public(self):
+        """Анонимный читатель получает кешируемую страницу без кук"""
+        for url in ('/', reverse('posts:post_detail', args=(self.post.pk,))):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age=30', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+                self.assertFalse(response.cookies)
+                self.assertFalse(response.wsgi_request.session.accessed)
+                self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_logged_in_page_is_not_public(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.seen = []
+
+        def view(request):
+            self.seen.append(self.router.db_for_read(Post))
+            if request.method == 'POST' or 'write' in request.GET:
+                self.router.db_for_write(Post)
+                self.seen.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        self.middleware = ReplicaMiddleware(view)
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_primary_by_default(self):
+        """Вне запроса, например в командах, чтение идет в основную базу"""
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_safe_request_reads_replica(self):
+        response = self.middleware(self.factory.get('/'))
+        self.assertIn(self.seen[0], ('replica_a', 'replica_b'))
+        self.assertNotIn(ReplicaMiddleware.cookie_name, response.cookies)
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def test_write_pins_primary_and_sets_cookie(self):
+        """После записи чтение идет в основную базу, в том числе потом"""
+        response = self.middleware(self.factory.get('/?write=1'))
+        self.assertIn(self.seen[0], ('replica_a', 'replica_b'))
+        self.assertEqual(self.seen[1], 'default')
+        cookie = response.cookies[ReplicaMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertEqual(response['Cache-Control'], 'private')
+        self.seen.clear()
+        request = self.factory.get('/')
+        request.COOKIES[ReplicaMiddleware.cookie_name] = '1'
+        self.middleware(request)
+        self.assertEqual(self.seen, ['default'])
+
+    def test_unsafe_request_uses_primary(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertEqual(self.seen, ['default', 'default'])
+        self.assertIn(ReplicaMiddleware.cookie_name, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_no_cookie(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertNotIn(ReplicaMiddleware.cookie_name, response.cookies)
+
+
+class SyncReplicasTests(SimpleTestCase):
+    def test_copy_database(self):
+        """Копия SQLite содержит данные основной базы"""
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'primary.sqlite3')
+            target = os.path.join(directory, 'replica.sqlite3')
+            connection = sqlite3.connect(source)
+            connection.execute('CREATE TABLE t (value TEXT)')
+            connection.execute("INSERT INTO t VALUES ('copied')")
+            connection.commit()
+            connection.close()
+            copy_database(source, target)
+            connection = sqlite3.connect(target)
+            rows = connection.execute('SELECT value FROM t').fetchall()
+            connection.close()
+            self.assertEqual(rows, [('copied',)])
+
+
+class SqliteTuningTests(SimpleTestCase):
+    def test_apply_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = sqlite3.connect(os.path.join(directory, 'db.sqlite3'))
+            try:
+                sqlite.apply_pragmas(database.cursor(), sqlite.get_pragmas())
+                journal_mode, = database.execute(
+                    'PRAGMA journal_mode').fetchone()
+                synchronous, = database.execute(
+                    'PRAGMA synchronous').fetchone()
+            finally:
+                database.close()
+        self.assertEqual(journal_mode, 'wal')
+        # 1 - NORMAL
+        self.assertEqual(synchronous, 1)
+
+
+class RetryOnLockedTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(sqlite.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connection_is_tuned(self):
+        """Новое соединение Django получает PRAGMA из core.sqlite"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0], sqlite.DEFAULT_PRAGMAS['busy_timeout']
+            )
+
+    def test_retries_locked_database(self):
+        """Каждая попытка идет в своей транзакции.
+
+        TestCase сам держит внешнюю транзакцию, поэтому проверка
+        in_atomic_block в декораторе подменена.
+        """
+        calls = []
+
+        @sqlite.retry_on_locked(attempts=3)
+        def write():
+            calls.append(connection.in_atomic_block)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'saved'
+
+        with mock.patch.object(sqlite, 'connection') as outer, \
+                self.assertLogs('core.sqlite', 'WARNING'):
+            outer.in_atomic_block = False
+            self.assertEqual(write(), 'saved')
+        self.assertEqual(calls, [True, True, True])
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_gives_up_and_ignores_other_errors(self):
+        @sqlite.retry_on_locked(attempts=2)
+        def locked():
+            raise OperationalError('database is locked')
+
+        @sqlite.retry_on_locked(attempts=2)
+        def broken():
+            raise OperationalError('no such table: posts_post')
+
+        with mock.patch.object(sqlite, 'connection') as outer, \
+                self.assertLogs('core.sqlite', 'WARNING'):
+            outer.in_atomic_block = False
+            with self.assertRaises(OperationalError):
+                locked()
+            self.assertEqual(self.sleep.call_count, 1)
+            with self.assertRaises(OperationalError):
+                broken()
+            self.assertEqual(self.sleep.call_count, 1)
+
+    def test_no_retry_inside_transaction(self):
+        calls = []
+
+        @sqlite.retry_on_locked()
+        def write():
+            calls.append(1)
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+class TemplateEngineTests(SimpleTestCase):
+    def test_django_templates_cached(self):
+        """Шаблоны Django компилируются один раз на процесс"""
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertIsInstance(loader, cached.Loader)
+        template = engines['django'].get_template('posts/index.html')
+        self.assertIs(
+            engines['django'].get_template('posts/index.html').template,
+            template.template,
+        )
+
+    def test_django_templates_reload_in_debug(self):
+        """В DEBUG шаблоны перечитываются с диска"""
+        params = next(
+            engine for engine in settings.TEMPLATES
+            if engine['NAME'] == 'django'
+        ).copy()
+        del params['BACKEND']
+        with override_settings(DEBUG=True):
+            engine = DjangoTemplates(params).engine
+        self.assertNotIsInstance(engine.template_loaders[0], cached.Loader)
+
+    @skipUnless(find_spec('jinja2'), 'не установлен jinja2')
+    def test_jinja_environment(self):
+        """Jinja2 знает addclass, thumbnail и переменные year"""
+        engine = engines['jinja2']
+        self.assertIn('addclass', engine.env.filters)
+        self.assertIsNone(engine.env.globals['thumbnail']('', '960'))
+        html = engine.from_string('{{ year }}{{ missing }}').render(
+            request=RequestFactory().get('/')
+        )
+        self.assertEqual(html, str(date.today().year))
+
+
+class StaticPipelineTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            STATIC_ROOT=directory.name,
+            STATIC_PRECOMPRESSED=True,
+            STATICFILES_STORAGE=(
+                'core.storage.CompressedManifestStaticFilesStorage'
+            ),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.root = directory.name
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collectstatic_writes_hashed_compressed_files(self):
+        name = staticfiles_storage.stored_name('js/comments.js')
+        self.assertRegex(name, r'^js/comments\.[0-9a-f]{12}\.js$')
+        self.assertTrue(os.path.exists(os.path.join(self.root, name + '.gz')))
+        # PNG уже сжат, копии не нужны
+        logo = staticfiles_storage.stored_name('img/logo.png')
+        self.assertFalse(os.path.exists(os.path.join(self.root, logo + '.gz')))
+
+    def test_middleware_serves_precompressed_immutable_files(self):
+        url = staticfiles_storage.url('js/comments.js')
+        response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('javascript', response['Content-Type'])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = Client().get(url)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn(b'data-more-comments', b''.join(response))
+        response = Client().get('/static/js/comments.js')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_middleware_respects_zero_quality(self):
+        """q=0 запрещает кодировку, а не упоминает ее"""
+        url = staticfiles_storage.url('js/comments.js')
+        path = os.path.join(
+            self.root, staticfiles_storage.stored_name('js/comments.js')
+        )
+        with open(path + '.br', 'wb') as file:
+            file.write(b'br')
+        for accept, expected in (('br, gzip', 'br'),
+                                 ('br;q=0, gzip', 'gzip'),
+                                 ('gzip;q=0', None),
+                                 ('*;q=0', None),
+                                 ('gzip;q=0.5, br;q=0.1', 'gzip')):
+            with self.subTest(accept=accept):
+                response = Client().get(url, HTTP_ACCEPT_ENCODING=accept)
+                self.assertEqual(response.get('Content-Encoding'), expected)
+
+
+class CompressionTests(SimpleTestCase):
+    html = '<article class="card">Пост</article>\n' * 100
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def get(self, response, path='/', encoding='gzip, br;q=0'):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(
+            self.factory.get(path, HTTP_ACCEPT_ENCODING=encoding)
+        )
+
+    def test_negotiate(self):
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+        self.assertIsNone(compression.negotiate('gzip;q=0, identity'))
+        self.assertIsNone(compression.negotiate(''))
+        self.assertEqual(
+            compression.negotiate('*'), compression.available_encodings()[0]
+        )
+        self.assertEqual(compression.negotiate('br;q=0.5, gzip'), 'gzip')
+
+    @skipUnless(compression.brotli, 'не установлен brotli')
+    def test_html_is_brotli_compressed(self):
+        response = self.get(HttpResponse(self.html), encoding='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(
+            compression.brotli.decompress(response.content).decode(),
+            self.html,
+        )
+        chunks = list(compression.compress_stream(
+            [b'<p>1</p>', b'<p>2</p>'], 'br'
+        ))
+        self.assertEqual(
+            compression.brotli.decompress(b''.join(chunks)),
+            b'<p>1</p><p>2</p>',
+        )
+
+    def test_html_is_gzipped(self):
+        response = HttpResponse(self.html)
+        response['ETag'] = '"page"'
+        response = self.get(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"page"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            gzip.decompress(response.content).decode(), self.html
+        )
+
+    def test_skipped_responses(self):
+        """Маленькие, медиа и картинки уходят как есть"""
+        cases = {
+            'small': (HttpResponse('<p>коротко</p>'), '/'),
+            'media': (HttpResponse(self.html), '/media/posts/a.txt'),
+            'image': (HttpResponse(b'x' * 5000, content_type='image/jpeg'),
+                      '/'),
+        }
+        for name, (response, path) in cases.items():
+            with self.subTest(name=name):
+                response = self.get(response, path)
+                self.assertNotIn('Content-Encoding', response)
+        response = self.get(HttpResponse(self.html), encoding='identity')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streaming_is_compressed_by_chunks(self):
+        lines = [f'{{"id": {number}}}\n'.encode() for number in range(50)]
+        response = self.get(StreamingHttpResponse(
+            iter(lines), content_type='application/x-ndjson'
+        ))
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b''.join(lines))
+
+    def test_compressed_body_is_cached_by_etag(self):
+        """Страница с тем же ETag не сжимается повторно"""
+        def page():
+            response = HttpResponse(self.html)
+            response['ETag'] = '"same"'
+            return response
+
+        first = self.get(page(), '/?page=2')
+        with mock.patch.object(
+            compression, 'compress', wraps=compression.compress
+        ) as compress:
+            second = self.get(page(), '/?page=2')
+            compress.assert_not_called()
+            self.get(page(), '/?page=3')
+            compress.assert_called_once()
+        self.assertEqual(first.content, second.content)
+
+
+@override_settings(UPLOAD_MAX_SIZE=100, DATA_UPLOAD_MAX_MEMORY_SIZE=20,
+                   FILE_UPLOAD_MAX_MEMORY_SIZE=10)
+class AsgiBodyTests(SimpleTestCase):
+    def setUp(self):
+        self.seen = []
+
+        def application(environ, start_response):
+            body = environ['wsgi.input']
+            self.seen.append((body, body.read()))
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'ok']
+
+        self.application = asgi.WsgiApplication(application, workers=1)
+        self.addCleanup(self.application.executor.shutdown)
+
+    def request(self, chunks, length=None):
+        headers = []
+        if length is not None:
+            headers.append((b'content-length', str(length).encode()))
+        scope = {'type': 'http', 'method': 'POST', 'path': '/',
+                 'headers': headers}
+        messages = [
+            {'type': 'http.request', 'body': chunk,
+             'more_body': number < len(chunks) - 1}
+            for number, chunk in enumerate(chunks)
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        return sent[0]['status'], len(messages)
+
+    def test_body_is_spooled(self):
+        """Тело больше FILE_UPLOAD_MAX_MEMORY_SIZE уходит во временный файл"""
+        status, _ = self.request([b'a' * 30, b'b' * 30], length=60)
+        self.assertEqual(status, HTTPStatus.OK)
+        body, data = self.seen[0]
+        self.assertEqual(data, b'a' * 30 + b'b' * 30)
+        self.assertTrue(body._rolled)
+        self.assertTrue(body.closed)
+
+    def test_oversized_body_rejected(self):
+        """Лишнее тело не читается: по Content-Length или по мере прихода"""
+        status, unread = self.request([b'a' * 80, b'b' * 80], length=160)
+        self.assertEqual(status, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(unread, 2)
+        status, unread = self.request([b'a' * 80, b'b' * 80, b'c'])
+        self.assertEqual(status, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(unread, 1)
+        self.assertEqual(self.seen, [])
@@ -0,0 +1,40 @@
+from django.conf import global_settings, settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+UPLOAD_MAX_SIZE: int = 10 * 1024 * 1024
+
+
+def get_upload_max_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', UPLOAD_MAX_SIZE)
+
+
+def get_body_max_size():
+    """Наибольшее тело запроса: файл до UPLOAD_MAX_SIZE и поля формы"""
+    fields = (settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+              or global_settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+    return get_upload_max_size() + fields
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Отбрасывает файлы больше UPLOAD_MAX_SIZE прямо во время загрузки.
+
+    Стоит первым в FILE_UPLOAD_HANDLERS: лишние байты не доходят до
+    диска, а имя поля попадает в request.rejected_uploads, чтобы форма
+    могла показать ошибку вместо молча пропавшего файла.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > get_upload_max_size():
+            if not hasattr(self.request, 'rejected_uploads'):
+                self.request.rejected_uploads = set()
+            self.request.rejected_uploads.add(self.field_name)
+            raise SkipFile
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
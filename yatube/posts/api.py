@@ -0,0 +1,199 @@
+"""Read-only JSON API и потоковая NDJSON-выгрузка.
+
+Списки постов листаются курсорами ?after= / ?before= так же, как
+html-ленты. Выгрузка отдает по одному объекту в строке и читает базу
+через iterator(chunk_size), поэтому память не растет с размером базы.
+"""
+from urllib.parse import urlencode
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from core.queries import query_budget
+
+from .models import Comment, FeedEntry, Group, Post
+from .support_def import AMT_POSTS, CursorPaginator, InvalidCursor
+
+# Наибольший размер страницы, который можно запросить через ?limit=
+MAX_LIMIT: int = 100
+# Сколько комментариев отдается вместе с постом
+COMMENTS_LIMIT: int = 100
+EXPORT_CHUNK_SIZE: int = 2000
+# Сколько строк выгрузки отдавать серверу за одну запись
+EXPORT_LINES_PER_WRITE: int = 500
+
+
+def error(message, status=400):
+    return JsonResponse({'detail': message}, status=status)
+
+
+def post_data(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'comments_count': post.comments_count,
+    }
+
+
+def comment_data(comment):
+    return {
+        'id': comment.pk,
+        'post': comment.post_id,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created,
+    }
+
+
+def group_data(group):
+    return {
+        'id': group.pk,
+        'title': group.title,
+        'slug': group.slug,
+        'description': group.description,
+    }
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', AMT_POSTS))
+    except ValueError:
+        return AMT_POSTS
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def cursor_response(request, queryset, serialize, keys=('pub_date', 'id'),
+                    params=None):
+    """Страница списка со ссылками на соседние страницы.
+
+    Испорченный курсор - ошибка 400, а не первая страница, как в html:
+    клиент API должен узнать, что листает не то.
+    """
+    cursor_paginator = CursorPaginator(queryset, get_limit(request), keys)
+    try:
+        if 'after' in request.GET:
+            page = cursor_paginator.page_after(request.GET['after'])
+        elif 'before' in request.GET:
+            page = cursor_paginator.page_before(request.GET['before'])
+        else:
+            page = cursor_paginator.first_page()
+    except InvalidCursor:
+        return error('Некорректный курсор')
+    params = dict(params or {})
+    if 'limit' in request.GET:
+        params['limit'] = request.GET['limit']
+    query = urlencode(params)
+    prefix = f'{request.path}?{query}&' if query else f'{request.path}?'
+    return JsonResponse({
+        'results': [serialize(obj) for obj in page.object_list],
+        'next': prefix + page.next_query if page.has_next() else None,
+        'previous': (
+            prefix + page.previous_query if page.has_previous() else None
+        ),
+    })
+
+
+@require_GET
+@query_budget(3)
+def posts_list(request):
+    """Посты, можно отфильтровать по ?group=<slug> и ?author=<username>"""
+    posts = Post.objects.select_related('author', 'group')
+    params = {}
+    if 'group' in request.GET:
+        params['group'] = request.GET['group']
+        posts = posts.filter(group__slug=params['group'])
+    if 'author' in request.GET:
+        params['author'] = request.GET['author']
+        posts = posts.filter(author__username=params['author'])
+    return cursor_response(request, posts, post_data, params=params)
+
+
+@require_GET
+@query_budget(3)
+def feed_list(request):
+    """Лента подписок текущего пользователя"""
+    if not request.user.is_authenticated:
+        return error('Нужна авторизация', status=401)
+    entries = FeedEntry.objects.filter(
+        user=request.user
+    ).select_related('post__author', 'post__group')
+    return cursor_response(
+        request, entries, lambda entry: post_data(entry.post),
+        keys=('pub_date', 'post_id'),
+    )
+
+
+@require_GET
+@query_budget(2)
+def post_detail(request, post_id):
+    """Пост с первыми комментариями"""
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    comments = post.comments.select_related('author').order_by(
+        'created', 'id'
+    )[:COMMENTS_LIMIT]
+    data = post_data(post)
+    data['comments'] = [comment_data(comment) for comment in comments]
+    return JsonResponse(data)
+
+
+@require_GET
+@query_budget(1)
+def groups_list(request):
+    groups = Group.objects.order_by('title', 'id')
+    return JsonResponse({'results': [group_data(group) for group in groups]})
+
+
+EXPORTS = {
+    'posts': (
+        lambda: Post.objects.select_related('author', 'group'), post_data
+    ),
+    'comments': (
+        lambda: Comment.objects.select_related('author'), comment_data
+    ),
+    'groups': (lambda: Group.objects.all(), group_data),
+}
+
+
+def export_lines(queryset, serialize):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    lines = []
+    for obj in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        lines.append(encoder.encode(serialize(obj)) + '\n')
+        if len(lines) == EXPORT_LINES_PER_WRITE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+@require_GET
+@query_budget(1)
+def export(request, kind):
+    """Потоковая выгрузка всех объектов вида kind в NDJSON.
+
+    Объекты идут по возрастанию id, ?after_id= продолжает прерванную
+    выгрузку с места обрыва.
+    """
+    if kind not in EXPORTS:
+        raise Http404
+    get_queryset, serialize = EXPORTS[kind]
+    queryset = get_queryset().order_by('pk')
+    if 'after_id' in request.GET:
+        try:
+            queryset = queryset.filter(pk__gt=int(request.GET['after_id']))
+        except ValueError:
+            return error('after_id должен быть числом')
+    response = StreamingHttpResponse(
+        export_lines(queryset, serialize),
+        content_type='application/x-ndjson; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.ndjson"'
+    return response
@@ -0,0 +1,145 @@
+"""Асинхронные обработчики событий для ASGI-развертывания.
+
+Протокол тот же, что у вьюх posts.events, но ожидание событий - это
+future в цикле asyncio, а не заблокированный поток: тысячи открытых
+соединений стоят по корутине. В поток уходит только чтение сессии
+и подписок при подключении.
+"""
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import connections
+
+from core.asgi import send_response, wait_disconnect
+
+from . import events
+
+JSON_HEADERS = (
+    ('content-type', 'application/json'),
+    ('cache-control', 'no-cache'),
+)
+STREAM_HEADERS = (
+    ('content-type', 'text/event-stream; charset=utf-8'),
+    ('cache-control', 'no-cache, no-transform'),
+    ('x-accel-buffering', 'no'),
+)
+
+
+def request_headers(scope):
+    return {
+        name.decode('latin-1').lower(): value.decode('latin-1')
+        for name, value in scope.get('headers', [])
+    }
+
+
+def query_params(scope):
+    return dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+
+
+def session_user_id(cookie_header):
+    """id пользователя из сессии, с теми же проверками, что у Django"""
+    cookie = SimpleCookie()
+    cookie.load(cookie_header)
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    request = SimpleNamespace(session=engine.SessionStore(morsel.value))
+    user = get_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+def subscribe(params, cookie_header):
+    """Каналы подписки; выполняется в потоке, как и запросы к базе"""
+    try:
+        user_id = None
+        if params.get('feed') == 'follow':
+            user_id = session_user_id(cookie_header)
+        return events.channels_for(params, user_id)
+    finally:
+        connections.close_all()
+
+
+async def get_channels(scope, params):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        None, subscribe, params, request_headers(scope).get('cookie', '')
+    )
+
+
+async def send_json(send, status, data):
+    await send_response(
+        send, status, JSON_HEADERS, json.dumps(data).encode()
+    )
+
+
+async def poll(scope, receive, send):
+    params = query_params(scope)
+    channels = await get_channels(scope, params)
+    if channels is None:
+        await send_json(send, 400, {'detail': 'Неизвестная лента'})
+        return
+    last_id = events.last_event_id(params.get('last'))
+    found = await events.broker.wait_async(
+        channels, last_id,
+        getattr(settings, 'EVENTS_POLL_TIMEOUT', events.EVENTS_POLL_TIMEOUT),
+    )
+    await send_json(send, 200, events.poll_data(found, last_id))
+
+
+async def send_chunk(send, text):
+    await send({
+        'type': 'http.response.body',
+        'body': text.encode(),
+        'more_body': True,
+    })
+
+
+async def stream(scope, receive, send):
+    """Server-Sent Events до отключения клиента"""
+    params = query_params(scope)
+    channels = await get_channels(scope, params)
+    if channels is None:
+        await send_json(send, 400, {'detail': 'Неизвестная лента'})
+        return
+    last_id = events.last_event_id(
+        request_headers(scope).get('last-event-id')
+    )
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT', events.EVENTS_HEARTBEAT)
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (name.encode(), value.encode()) for name, value in STREAM_HEADERS
+        ],
+    })
+    await send_chunk(send, f'retry: {events.EVENTS_RETRY}\n\n')
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        while True:
+            waiting = asyncio.ensure_future(
+                events.broker.wait_async(channels, last_id, heartbeat)
+            )
+            await asyncio.wait(
+                {waiting, disconnected},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected.done():
+                waiting.cancel()
+                return
+            found = waiting.result()
+            if not found:
+                await send_chunk(send, ': ping\n\n')
+                continue
+            last_id = found[-1].id
+            await send_chunk(
+                send, ''.join(events.format_event(event) for event in found)
+            )
+    finally:
+        disconnected.cancel()
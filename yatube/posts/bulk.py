@@ -0,0 +1,71 @@
+"""Массовая запись постов и комментариев с исходными датами.
+
+Используется командами import_content и seed_yatube. Поля pub_date и
+created объявлены с auto_now_add, и bulk_create записывает в них
+текущее время. Исходные даты проставляются следом через bulk_update
+по id, а метаданные полей не меняются: обычные сохранения в других
+потоках не затронуты.
+"""
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+
+def lock_for_insert(model, using):
+    """Не дать другим писателям вставлять строки до конца транзакции.
+
+    SQLite начинает транзакцию отложенно и до первой записи пускает
+    чужие вставки. Пустой UPDATE сразу берет блокировку записи, как
+    BEGIN IMMEDIATE. На других базах блокируется последняя строка: в
+    InnoDB блокировка следующего ключа закрывает вставку после нее.
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        table = connection.ops.quote_name(model._meta.db_table)
+        column = connection.ops.quote_name(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET {column} = {column} WHERE 0'
+            )
+    else:
+        list(
+            model.objects.using(using).select_for_update()
+            .order_by('-pk').values_list('pk', flat=True)[:1]
+        )
+
+
+def assign_ids(model, objects, using):
+    """Проставить id объектам без него, следующие за наибольшим занятым.
+
+    Вызывается под lock_for_insert, иначе параллельная вставка может
+    занять те же id.
+    """
+    last = max(
+        model.objects.using(using).aggregate(last=Max('pk'))['last'] or 0,
+        *(obj.pk for obj in objects if obj.pk is not None),
+        0,
+    )
+    for obj in objects:
+        if obj.pk is None:
+            last += 1
+            obj.pk = last
+
+
+def bulk_create_dated(model, objects, field, batch_size=None):
+    """bulk_create с исходными датами в поле field с auto_now_add.
+
+    Для bulk_update нужны id. PostgreSQL возвращает их из bulk_create,
+    а SQLite нет, поэтому там id раздаются заранее под блокировкой
+    записи.
+    """
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using):
+        if not connections[using].features.can_return_ids_from_bulk_insert:
+            lock_for_insert(model, using)
+            assign_ids(model, objects, using)
+        dates = [getattr(obj, field) for obj in objects]
+        model.objects.using(using).bulk_create(objects, batch_size=batch_size)
+        for obj, date in zip(objects, dates):
+            setattr(obj, field, date)
+        model.objects.using(using).bulk_update(
+            objects, [field], batch_size=batch_size
+        )
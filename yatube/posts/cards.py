@@ -0,0 +1,91 @@
+"""Кеш отрендеренных карточек постов.
+
+Ключ карточки собирается из id поста и штампов поста, автора и группы.
+Штамп - произвольное уникальное значение в кеше, которое меняется при
+каждом сохранении или удалении объекта, поэтому устаревшие карточки
+просто перестают находиться и вытесняются сами.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.translation import get_language
+
+from . import thumbnails
+
+CARD_TIMEOUT: int = 60 * 60 * 24
+
+
+def _stamp_key(kind, pk):
+    return f'stamp:{kind}:{pk}'
+
+
+def bump(kind, pk):
+    """Сменить штамп объекта и тем самым сбросить зависящие карточки"""
+    cache.set(_stamp_key(kind, pk), time.time_ns(), None)
+
+
+def bump_all():
+    """Сбросить сразу все карточки, например после пересчета счетчиков"""
+    bump('cards', 'all')
+
+
+def _stamps(keys):
+    stamps = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in stamps}
+    if missing:
+        cache.set_many(missing, None)
+        stamps.update(missing)
+    return stamps
+
+
+def _card_key(template_name, post, stamps):
+    parts = [
+        template_name,
+        get_language() or '',
+        str(post.pk),
+        str(stamps[_stamp_key('cards', 'all')]),
+        str(stamps[_stamp_key('post', post.pk)]),
+        str(stamps[_stamp_key('user', post.author_id)]),
+        str(stamps.get(_stamp_key('group', post.group_id), '')),
+    ]
+    digest = hashlib.md5(':'.join(parts).encode()).hexdigest()
+    return f'post_card:{digest}'
+
+
+def render_cards(posts, template_name):
+    """Список html карточек постов в исходном порядке.
+
+    На прогретом кеше это два вызова get_many без рендера шаблонов.
+    Карточкам передается card_image - готовая миниатюра картинки поста.
+    """
+    posts = list(posts)
+    stamp_keys = {_stamp_key('cards', 'all')}
+    for post in posts:
+        stamp_keys.add(_stamp_key('post', post.pk))
+        stamp_keys.add(_stamp_key('user', post.author_id))
+        if post.group_id:
+            stamp_keys.add(_stamp_key('group', post.group_id))
+    stamps = _stamps(list(stamp_keys))
+    keys = [_card_key(template_name, post, stamps) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {}
+    to_render = [
+        (key, post) for key, post in zip(keys, posts) if key not in cards
+    ]
+    if to_render:
+        template = get_template(template_name)
+        # Миниатюры всех карточек ищутся разом, а не тегом в каждой
+        card_images = thumbnails.resolve(
+            [post.image for _, post in to_render], *thumbnails.CARD
+        )
+        for key, post in to_render:
+            missing[key] = template.render({
+                'post': post,
+                'card_image': card_images.get(post.image.name),
+            })
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+        cards.update(missing)
+    return [cards[key] for key in keys]
@@ -0,0 +1,152 @@
+"""Денормализованные счетчики постов, комментариев, подписок и групп.
+
+Счетчики меняются атомарно через F()-выражения в момент записи,
+поэтому страницы читают готовые числа вместо COUNT(*).
+Расхождения исправляет команда recount.
+"""
+from django.db.models import (Count, F, IntegerField, OuterRef, Q,
+                              Subquery, Value)
+from django.db.models.functions import Coalesce, Substr
+
+from . import cards, follow_graph, page_cache
+from .models import (Comment, Follow, Group, GroupStats, Post, User,
+                     UserStats)
+
+PREVIEW_LENGTH = 200
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    """Изменить счетчик пользователя.
+
+    Если строки со счетчиками еще нет, при увеличении она создается
+    пересчетом по реальным данным.
+    """
+    updated = _change(UserStats.objects.filter(user_id=user_id), field, delta)
+    if not updated and delta > 0:
+        recount_users(User.objects.filter(pk=user_id))
+
+
+def change_post(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recount_users(users=None):
+    """Пересчитать счетчики пользователей по реальным данным.
+
+    Полный пересчет идет после массовых загрузок без сигналов, поэтому
+    заодно сбрасывает граф подписок.
+    """
+    if users is None:
+        users = User.objects.all()
+        follow_graph.reset_all()
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in users.values_list('pk', flat=True)],
+        ignore_conflicts=True,
+    )
+    return UserStats.objects.filter(user__in=users).update(
+        posts_count=_count(Post, 'author'),
+        followers_count=_count(Follow, 'author'),
+        following_count=_count(Follow, 'user'),
+    )
+
+
+def recount_posts():
+    """Пересчитать количество комментариев у всех постов"""
+    updated = Post.objects.update(comments_count=_count(Comment, 'post'))
+    cards.bump_all()
+    page_cache.invalidate_all()
+    return updated
+
+
+def preview(text):
+    return text[:PREVIEW_LENGTH]
+
+
+def _last_post_fields():
+    """Поля последнего поста группы подзапросами для update()"""
+    latest = Post.objects.filter(group=OuterRef('pk')).order_by(
+        '-pub_date', '-id'
+    )
+    return {
+        'last_post': Subquery(latest.values('id')[:1]),
+        'last_post_date': Subquery(latest.values('pub_date')[:1]),
+        'last_post_text': Coalesce(
+            Substr(Subquery(latest.values('text')[:1]), 1, PREVIEW_LENGTH),
+            Value(''),
+        ),
+    }
+
+
+def recount_groups(groups=None):
+    """Пересобрать сводку групп: число постов и последний пост"""
+    groups = Group.objects.all() if groups is None else groups
+    GroupStats.objects.bulk_create(
+        [GroupStats(group_id=pk)
+         for pk in groups.values_list('pk', flat=True)],
+        ignore_conflicts=True,
+    )
+    return GroupStats.objects.filter(group__in=groups).update(
+        posts_count=_count(Post, 'group'), **_last_post_fields()
+    )
+
+
+def add_group_post(post):
+    """Учесть пост в сводке его группы"""
+    stats = GroupStats.objects.filter(group_id=post.group_id)
+    if not _change(stats, 'posts_count', 1):
+        recount_groups(Group.objects.filter(pk=post.group_id))
+        return
+    # Пост становится последним, только если он не старше текущего
+    stats.filter(
+        Q(last_post_date__isnull=True)
+        | Q(last_post_date__lt=post.pub_date)
+        | Q(last_post_date=post.pub_date, last_post_id__lt=post.pk)
+    ).update(
+        last_post=post.pk,
+        last_post_date=post.pub_date,
+        last_post_text=preview(post.text),
+    )
+
+
+def remove_group_post(group_id, post_id):
+    """Убрать пост из сводки группы.
+
+    Последний пост ищется заново, только если убрали именно его.
+    """
+    stats = GroupStats.objects.filter(group_id=group_id)
+    _change(stats, 'posts_count', -1)
+    stats.filter(last_post_id=post_id).update(**_last_post_fields())
+
+
+def move_group_post(post, old_group_id, created):
+    """Обновить сводку групп после сохранения поста"""
+    if created or old_group_id != post.group_id:
+        if old_group_id and not created:
+            remove_group_post(old_group_id, post.pk)
+        if post.group_id:
+            add_group_post(post)
+    elif post.group_id:
+        # Текст последнего поста мог измениться
+        GroupStats.objects.filter(
+            group_id=post.group_id, last_post_id=post.pk
+        ).update(last_post_text=preview(post.text))
@@ -0,0 +1,266 @@
+"""События о новых постах и комментариях: Server-Sent Events и long-poll.
+
+Сигналы сохранения Post и Comment после коммита публикуют событие
+в брокер процесса. Брокер хранит последние EVENTS_BUFFER событий
+с общей сквозной нумерацией, поэтому клиент по Last-Event-ID или ?last=
+получает пропущенное при переподключении.
+
+Каналы: index - все новые посты, author:<id> - посты автора (лента
+подписок слушает каналы всех своих авторов), post:<id> - комментарии
+поста.
+
+Брокер живет в памяти процесса: события видят только клиенты того же
+процесса, который сохранил объект. В ASGI-развертывании (yatube.asgi)
+адреса событий обслуживает posts.asgi, и ожидающие соединения не
+занимают потоков; оно же включает EVENTS_STREAMING. Под WSGI каждое
+ожидающее соединение держит поток сервера, поэтому без EVENTS_STREAMING
+поток событий отключен, long-poll отвечает не дожидаясь событий,
+а страницы опрашивают его раз в EVENTS_POLL_INTERVAL секунд.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from core.queries import query_budget
+
+from . import follow_graph
+
+EVENTS_BUFFER: int = 1000
+# Сколько ждет ответа long-poll, если событий нет
+EVENTS_POLL_TIMEOUT: int = 25
+# Как часто поток шлет комментарий, чтобы прокси не закрыл соединение
+EVENTS_HEARTBEAT: int = 15
+# Сколько живет поток под WSGI, потом браузер переподключается
+EVENTS_STREAM_SECONDS: int = 60
+# Через сколько миллисекунд EventSource переподключается после обрыва
+EVENTS_RETRY: int = 3000
+# Как часто страницы опрашивают poll, если поток событий выключен
+EVENTS_POLL_INTERVAL: int = 30
+
+Event = namedtuple('Event', 'id channel name data')
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Broker:
+    """Публикация и ожидание событий из потоков и из asyncio"""
+
+    def __init__(self, size=EVENTS_BUFFER):
+        self._events = deque(maxlen=size)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self._waiters = set()
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._last_id
+
+    def publish(self, channel, name, data):
+        with self._condition:
+            self._last_id += 1
+            self._events.append(Event(self._last_id, channel, name, data))
+            self._condition.notify_all()
+            waiters, self._waiters = self._waiters, set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _since(self, channels, last_id):
+        return [
+            event for event in self._events
+            if event.id > last_id and event.channel in channels
+        ]
+
+    def wait(self, channels, last_id, timeout):
+        """События после last_id; блокирует поток не дольше timeout"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = self._since(channels, last_id)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(remaining)
+
+    async def wait_async(self, channels, last_id, timeout):
+        """То же для asyncio: ждет future, а не поток"""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            future = loop.create_future()
+            waiter = (loop, future)
+            with self._condition:
+                events = self._since(channels, last_id)
+                remaining = deadline - loop.time()
+                if events or remaining <= 0:
+                    return events
+                self._waiters.add(waiter)
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    self._waiters.discard(waiter)
+
+
+broker = Broker()
+
+
+def index_channel():
+    return 'index'
+
+
+def author_channel(author_id):
+    return f'author:{author_id}'
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+def publish_post(post):
+    """Новый пост для главной и для подписчиков автора"""
+    data = {'id': post.pk, 'author': post.author_id}
+
+    def publish():
+        broker.publish(index_channel(), 'post', data)
+        broker.publish(author_channel(post.author_id), 'post', data)
+
+    transaction.on_commit(publish)
+
+
+def publish_comment(comment):
+    data = {'id': comment.pk, 'post': comment.post_id}
+    transaction.on_commit(lambda: broker.publish(
+        post_channel(comment.post_id), 'comment', data
+    ))
+
+
+def channels_for(params, user_id):
+    """Каналы ленты из параметров запроса; None, если ленты нет"""
+    feed = params.get('feed')
+    if feed == 'index':
+        return {index_channel()}
+    if feed == 'follow' and user_id is not None:
+        return {
+            author_channel(author_id)
+            for author_id in follow_graph.following_ids(user_id)
+        }
+    post_id = params.get('post', '')
+    if feed == 'post' and post_id.isdigit():
+        return {post_channel(int(post_id))}
+    return None
+
+
+def last_event_id(value):
+    """Последнее полученное клиентом событие; без него - только новые"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return broker.last_id
+
+
+def format_event(event):
+    data = json.dumps(event.data)
+    return f'id: {event.id}\nevent: {event.name}\ndata: {data}\n\n'
+
+
+def poll_data(events, last_id):
+    return {
+        'last': events[-1].id if events else last_id,
+        'events': [
+            {'id': event.id, 'event': event.name, 'data': event.data}
+            for event in events
+        ],
+    }
+
+
+def stream_lines(channels, last_id, seconds):
+    yield f'retry: {EVENTS_RETRY}\n\n'
+    deadline = time.monotonic() + seconds
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT', EVENTS_HEARTBEAT)
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        events = broker.wait(channels, last_id, min(heartbeat, remaining))
+        if not events:
+            yield ': ping\n\n'
+            continue
+        last_id = events[-1].id
+        yield ''.join(format_event(event) for event in events)
+
+
+def streaming():
+    """Можно ли держать соединение открытым в ожидании событий"""
+    return getattr(settings, 'EVENTS_STREAMING', False)
+
+
+def poll_interval():
+    return getattr(settings, 'EVENTS_POLL_INTERVAL', EVENTS_POLL_INTERVAL)
+
+
+def request_channels(request):
+    return channels_for(
+        request.GET,
+        request.user.pk if request.user.is_authenticated else None,
+    )
+
+
+@require_GET
+@query_budget(3)
+def stream(request):
+    """Поток событий ленты или поста в формате Server-Sent Events"""
+    if not streaming():
+        raise Http404('Поток событий выключен')
+    channels = request_channels(request)
+    if channels is None:
+        return JsonResponse({'detail': 'Неизвестная лента'}, status=400)
+    seconds = getattr(settings, 'EVENTS_STREAM_SECONDS',
+                      EVENTS_STREAM_SECONDS)
+    response = StreamingHttpResponse(
+        stream_lines(
+            channels,
+            last_event_id(request.META.get('HTTP_LAST_EVENT_ID')),
+            seconds,
+        ),
+        content_type='text/event-stream; charset=utf-8',
+    )
+    # no-transform: поток нельзя сжимать и буферизовать целиком
+    response['Cache-Control'] = 'no-cache, no-transform'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+@query_budget(3)
+def poll(request):
+    """Long-poll для браузеров без EventSource.
+
+    Отвечает сразу, если после ?last= уже есть события, иначе ждет их
+    не дольше EVENTS_POLL_TIMEOUT, а без EVENTS_STREAMING не ждет
+    совсем. В ответе last для следующего запроса.
+    """
+    channels = request_channels(request)
+    if channels is None:
+        return JsonResponse({'detail': 'Неизвестная лента'}, status=400)
+    last_id = last_event_id(request.GET.get('last'))
+    timeout = 0
+    if streaming():
+        timeout = getattr(settings, 'EVENTS_POLL_TIMEOUT',
+                          EVENTS_POLL_TIMEOUT)
+    events = broker.wait(channels, last_id, timeout)
+    response = JsonResponse(poll_data(events, last_id))
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,102 @@
+"""Материализованная лента подписок.
+
+Каждый новый пост раскладывается по входящим лентам подписчиков
+(fan-out on write), поэтому страница follow_index - это один проход по
+индексу (user, pub_date, post) таблицы FeedEntry без соединения
+Post с Follow.
+"""
+from django.db import connections, router
+
+from .models import FeedEntry, Follow, Post
+
+# Сколько последних записей хранится во входящей ленте пользователя
+FEED_LIMIT: int = 1000
+BATCH_SIZE: int = 500
+
+
+def fan_out(post):
+    """Разложить новый пост по лентам всех подписчиков автора"""
+    follower_ids = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post_id=post.pk,
+                      author_id=post.author_id, pub_date=post.pub_date)
+            for user_id in follower_ids
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_many(follower_ids)
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту подписчика последние посты нового автора"""
+    recent = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'pub_date')[:FEED_LIMIT]
+    )
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+            for post_id, pub_date in recent
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def prune(user_id, author_id):
+    """Убрать из ленты посты автора, от которого отписались"""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def trim(user_id):
+    """Оставить в ленте пользователя не больше FEED_LIMIT записей"""
+    trim_many([user_id])
+
+
+def trim_many(user_ids):
+    """То же для многих лент: один DELETE на пачку пользователей.
+
+    Номер записи в ленте считает ROW_NUMBER() по индексу
+    (user, pub_date, post), удаляются записи дальше FEED_LIMIT.
+    """
+    user_ids = list(user_ids)
+    table = FeedEntry._meta.db_table
+    connection = connections[router.db_for_write(FeedEntry)]
+    with connection.cursor() as cursor:
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+                'PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+                f') AS position FROM {table} WHERE user_id IN '
+                f'({", ".join(["%s"] * len(batch))})'
+                ') AS ranked WHERE position > %s)',
+                [*batch, FEED_LIMIT],
+            )
+
+
+def rebuild(user_id):
+    """Собрать ленту пользователя заново по его подпискам"""
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    recent = (
+        Post.objects.filter(author__following__user_id=user_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'author_id', 'pub_date')[:FEED_LIMIT]
+    )
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, pub_date=pub_date)
+            for post_id, author_id, pub_date in recent
+        ],
+        batch_size=BATCH_SIZE,
+    )
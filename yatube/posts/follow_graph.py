@@ -0,0 +1,82 @@
+"""Граф подписок в кеше.
+
+Для каждого пользователя в кеше лежит отсортированный массив id авторов,
+на которых он подписан (array('I'), 4 байта на подписку). Проверка
+подписки - бинарный поиск по нему без запроса к таблице Follow.
+
+Сигналы Follow обновляют массив после коммита записи (write-through):
+откаченная подписка в граф не попадает. После bulk_create, который
+сигналов не шлет, граф сбрасывается целиком через reset_all().
+"""
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+GRAPH_TIMEOUT: int = 60 * 60 * 24
+TYPECODE = 'I'
+_GENERATION_KEY = 'follow_graph:generation'
+
+
+def _key(user_id):
+    generation = cache.get_or_set(_GENERATION_KEY, time.time_ns, None)
+    return f'follow_graph:{generation}:{user_id}'
+
+
+def _load(user_id):
+    return array(TYPECODE, Follow.objects.filter(
+        user_id=user_id
+    ).order_by('author_id').values_list('author_id', flat=True))
+
+
+def following_ids(user_id):
+    """Отсортированный массив id авторов, на которых подписан пользователь"""
+    key = _key(user_id)
+    data = cache.get(key)
+    if data is not None:
+        ids = array(TYPECODE)
+        ids.frombytes(data)
+        return ids
+    ids = _load(user_id)
+    cache.set(key, ids.tobytes(), GRAPH_TIMEOUT)
+    return ids
+
+
+def is_following(user_id, author_id):
+    ids = following_ids(user_id)
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def _update(user_id, author_id, add):
+    key = _key(user_id)
+    data = cache.get(key)
+    if data is None:
+        # Массива нет в кеше: при следующем чтении он загрузится из базы
+        return
+    ids = array(TYPECODE)
+    ids.frombytes(data)
+    index = bisect_left(ids, author_id)
+    present = index < len(ids) and ids[index] == author_id
+    if add and not present:
+        insort(ids, author_id)
+    elif not add and present:
+        del ids[index]
+    cache.set(key, ids.tobytes(), GRAPH_TIMEOUT)
+
+
+def add(user_id, author_id):
+    transaction.on_commit(lambda: _update(user_id, author_id, add=True))
+
+
+def remove(user_id, author_id):
+    transaction.on_commit(lambda: _update(user_id, author_id, add=False))
+
+
+def reset_all():
+    """Сбросить граф всех пользователей, например после массовой загрузки"""
+    cache.set(_GENERATION_KEY, time.time_ns(), None)
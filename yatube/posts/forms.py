@@ -1,9 +1,37 @@
 from django import forms
+from django.core.files.images import get_image_dimensions
+from django.core.files.uploadedfile import UploadedFile
 
+from core.uploads import get_upload_max_size
+
+from . import images
 from .models import Comment, Post
 
 
 class PostForm(forms.ModelForm):
+    def __init__(self, *args, rejected_uploads=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rejected_uploads = rejected_uploads
+
+    def clean(self):
+        cleaned_data = super().clean()
+        max_size = get_upload_max_size() // (1024 * 1024)
+        for field in self.rejected_uploads:
+            self.add_error(field, f'Файл больше {max_size} МБ')
+        return cleaned_data
+
+    def clean_image(self):
+        """Новая картинка сохраняется уже пережатой и с размерами"""
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image = images.normalize(image)
+            self.instance.image_width, self.instance.image_height = (
+                get_image_dimensions(image)
+            )
+        elif not image:
+            self.instance.image_width = self.instance.image_height = None
+        return image
+
     class Meta:
         model = Post
         fields = {'image', 'text', 'group'}
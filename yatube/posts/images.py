@@ -0,0 +1,56 @@
+"""Нормализация картинок постов при загрузке.
+
+Оригинал с камеры может весить десятки мегабайт, а sorl перечитывает его
+для каждой миниатюры. Поэтому картинка сохраняется уже повернутой по
+EXIF, без метаданных, уменьшенной до IMAGE_MAX_SIZE по большей стороне
+и пережатой в progressive JPEG (или WebP, если Pillow его поддерживает).
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+IMAGE_MAX_SIZE: int = 1920
+IMAGE_QUALITY: int = 85
+
+
+def get_format():
+    image_format = getattr(settings, 'POST_IMAGE_FORMAT', 'JPEG').upper()
+    if image_format == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return image_format
+
+
+def flatten(image):
+    """RGB без прозрачности: прозрачные области становятся белыми"""
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def normalize(upload):
+    """Пережатая картинка из загруженного файла.
+
+    Метаданные не копируются: в новый файл попадают только пиксели.
+    """
+    upload.seek(0)
+    with Image.open(upload) as source:
+        image = flatten(ImageOps.exif_transpose(source))
+    max_size = getattr(settings, 'POST_IMAGE_MAX_SIZE', IMAGE_MAX_SIZE)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    image_format = get_format()
+    buffer = BytesIO()
+    if image_format == 'WEBP':
+        image.save(buffer, 'WEBP', quality=IMAGE_QUALITY, method=6)
+        extension = 'webp'
+    else:
+        image.save(buffer, 'JPEG', quality=IMAGE_QUALITY, optimize=True,
+                   progressive=True)
+        extension = 'jpg'
+    stem = os.path.splitext(os.path.basename(upload.name))[0] or 'image'
+    return ContentFile(buffer.getvalue(), name=f'{stem}.{extension}')
@@ -0,0 +1,119 @@
+import json
+import platform
+import time
+
+import django
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.exceptions import TemplateDoesNotExist
+from django.template.utils import InvalidTemplateEngineError
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+from posts.management.commands.bench_views import percentile
+from posts.models import Post
+from posts.support_def import AMT_POSTS, CursorPaginator
+
+CARD_TEMPLATE = 'posts/includes/post_item.html'
+SEPARATOR = '<hr>'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время рендера главной страницы с лентой из '
+            f'{AMT_POSTS} постов шаблонами Django и Jinja2. Кеш карточек '
+            'и лент не используется: каждый раз рендерятся все шаблоны')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Сколько рендеров каждым движком не учитывать'
+        )
+        parser.add_argument(
+            '--engines', nargs='*', default=['django', 'jinja2'],
+            help='Имена движков из TEMPLATES'
+        )
+        parser.add_argument('--output', help='Файл для результата')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.select_related('author', 'group')
+        page_obj = CursorPaginator(posts, AMT_POSTS).first_page()
+        if not page_obj:
+            raise CommandError(
+                'В базе нет постов, заполните ее командой seed_yatube'
+            )
+        request = self.get_request()
+        results = {}
+        for alias in options['engines']:
+            try:
+                engine = engines[alias]
+            except InvalidTemplateEngineError:
+                raise CommandError(f'Движок {alias} не настроен в TEMPLATES')
+            results[alias] = self.measure(engine, request, page_obj, options)
+            self.stderr.write(f'{alias}: p50 {results[alias]["p50_ms"]} мс')
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'posts': len(page_obj),
+                'images': sum(1 for post in page_obj if post.image),
+            },
+            'results': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def get_request(self):
+        path = reverse('posts:index')
+        request = RequestFactory().get(path)
+        request.user = AnonymousUser()
+        request.resolver_match = resolve(path)
+        return request
+
+    def render_page(self, engine, request, page_obj):
+        """Страница целиком, как на промахе кеша ленты и карточек"""
+        card = engine.get_template(CARD_TEMPLATE)
+        card_images = thumbnails.resolve(
+            [post.image for post in page_obj], *thumbnails.CARD
+        )
+        cards = [
+            card.render({
+                'post': post,
+                'card_image': card_images.get(post.image.name),
+            })
+            for post in page_obj
+        ]
+        feed = SEPARATOR.join(cards) + engine.get_template(
+            'posts/includes/paginator.html'
+        ).render({'page_obj': page_obj}, request)
+        return engine.get_template('posts/index.html').render(
+            {'page_obj': page_obj, 'feed': mark_safe(feed)}, request
+        )
+
+    def measure(self, engine, request, page_obj, options):
+        try:
+            html = self.render_page(engine, request, page_obj)
+        except TemplateDoesNotExist as error:
+            raise CommandError(f'В движке {engine.name} нет шаблона {error}')
+        for _ in range(options['warmup']):
+            self.render_page(engine, request, page_obj)
+        timings = []
+        for _ in range(options['iterations']):
+            start = time.perf_counter()
+            self.render_page(engine, request, page_obj)
+            timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'bytes': len(html.encode()),
+        }
@@ -0,0 +1,196 @@
+import json
+import math
+import platform
+import time
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from core.queries import QueryRecorder
+from posts import search
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+from posts.support_def import AMT_POSTS
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку, число запросов и размер ответа '
+            'страниц приложения posts и выводит результат в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Сколько запросов к каждой странице не учитывать'
+        )
+        parser.add_argument(
+            '--user',
+            help='Пользователь для страниц, требующих входа '
+                 '(по умолчанию тот, у кого больше всего подписок)'
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом'
+        )
+        parser.add_argument(
+            '--writes', action='store_true',
+            help='Замерять и подписку с отпиской (меняют данные)'
+        )
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='Замерять только страницы с этими именами'
+        )
+        parser.add_argument('--output', help='Файл для результата')
+
+    def handle(self, *args, **options):
+        if not Post.objects.exists():
+            raise CommandError(
+                'В базе нет постов, заполните ее командой seed_yatube'
+            )
+        viewer = self.get_viewer(options['user'])
+        client = Client()
+        client.force_login(viewer)
+        anonymous = Client()
+        results = {}
+        for name, urls, as_user in self.scenarios(viewer, options):
+            if options['only'] is not None and name not in options['only']:
+                continue
+            request = client.get if as_user else anonymous.get
+            results[name] = self.measure(request, urls, options)
+            self.stderr.write(
+                f'{name}: p50 {results[name]["p50_ms"]} мс, '
+                f'запросов {results[name]["queries"]}'
+            )
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'cold_cache': options['cold'],
+                'viewer': viewer.username,
+                'data': {
+                    'users': User.objects.count(),
+                    'groups': Group.objects.count(),
+                    'posts': Post.objects.count(),
+                    'comments': Comment.objects.count(),
+                    'follows': Follow.objects.count(),
+                },
+            },
+            'results': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def get_viewer(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден')
+        viewer = User.objects.annotate(
+            following_total=Count('follower')
+        ).order_by('-following_total', 'pk').first()
+        if viewer is None:
+            raise CommandError('В базе нет пользователей')
+        return viewer
+
+    def scenarios(self, viewer, options):
+        """Имя страницы, адреса для одной итерации и нужен ли вход"""
+        author = (
+            UserStats.objects.select_related('user')
+            .order_by('-posts_count').first()
+        )
+        author = author.user if author else viewer
+        group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        post = Post.objects.order_by('-comments_count', '-pk').first()
+        own_post = viewer.posts.order_by('-pk').first()
+        last_page = max(math.ceil(Post.objects.count() / AMT_POSTS), 2)
+        words = search.tokenize(post.text)
+        index = reverse('posts:index')
+        yield 'index', (index,), False
+        yield 'index_logged_in', (index,), True
+        yield 'index_middle_page', (f'{index}?page={last_page // 2}',), False
+        yield 'index_last_page', (f'{index}?last=1',), False
+        if group is not None:
+            yield 'group_list', (
+                reverse('posts:group_list', args=(group.slug,)),
+            ), False
+        yield 'profile', (
+            reverse('posts:profile', args=(author.username,)),
+        ), False
+        yield 'post_detail', (
+            reverse('posts:post_detail', args=(post.pk,)),
+        ), False
+        if words:
+            search_url = f'{reverse("posts:search")}?q={words[0]}'
+            yield 'search', (search_url,), False
+        yield 'follow_index', (reverse('posts:follow_index'),), True
+        yield 'post_create_form', (reverse('posts:post_create'),), True
+        if own_post is not None:
+            yield 'post_edit_form', (
+                reverse('posts:post_edit', args=(own_post.pk,)),
+            ), True
+        if not options['writes']:
+            return
+        target = User.objects.exclude(pk=viewer.pk).exclude(
+            following__user=viewer
+        ).order_by('pk').first()
+        if target is not None:
+            # Подписка и отписка идут парой, данные в итоге не меняются
+            yield 'follow_unfollow', (
+                reverse('posts:profile_follow', args=(target.username,)),
+                reverse('posts:profile_unfollow', args=(target.username,)),
+            ), True
+
+    def measure(self, request, urls, options):
+        for _ in range(options['warmup']):
+            for url in urls:
+                request(url)
+        timings = []
+        queries = []
+        db_timings = []
+        sizes = []
+        status = None
+        for _ in range(options['iterations']):
+            if options['cold']:
+                cache.clear()
+            size = 0
+            with QueryRecorder() as recorder:
+                start = time.perf_counter()
+                for url in urls:
+                    response = request(url)
+                    size += len(response.content)
+                timings.append((time.perf_counter() - start) * 1000)
+            status = response.status_code
+            queries.append(len(recorder))
+            db_timings.append(recorder.duration * 1000)
+            sizes.append(size)
+        return {
+            'urls': list(urls),
+            'status': status,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'max_ms': round(max(timings), 3),
+            'db_p50_ms': round(percentile(db_timings, 50), 3),
+            'queries': max(queries),
+            'bytes': max(sizes),
+        }
@@ -0,0 +1,299 @@
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.uploads import get_upload_max_size
+from posts import counters, feed, images, search
+from posts.bulk import bulk_create_dated
+from posts.models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 1000
+
+
+def read_rows(stream, file_format):
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_date(value):
+    """Дата из ISO 8601, без часового пояса считается в поясе сайта"""
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Некорректная дата: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def parse_id(value):
+    return int(value) if value not in (None, '') else None
+
+
+class Command(BaseCommand):
+    help = ('Загружает посты, комментарии или подписки из JSONL или CSV '
+            'пачками bulk_create с сохранением исходных дат')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind', choices=('posts', 'comments', 'follows'),
+        )
+        parser.add_argument(
+            'path', help='Файл .jsonl или .csv, "-" - стандартный ввод'
+        )
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат файла (по умолчанию по расширению)'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создавать неизвестных авторов без пароля'
+        )
+        parser.add_argument(
+            '--create-groups', action='store_true',
+            help='Создавать неизвестные группы, иначе пост будет без группы'
+        )
+        parser.add_argument(
+            '--images',
+            help='Каталог с картинками, пути в поле image считаются от него'
+        )
+        parser.add_argument(
+            '--skip-maintenance', action='store_true',
+            help='Не пересчитывать счетчики, ленты и поиск после загрузки'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.users = {}
+        self.groups = {}
+        self.affected_users = set()
+        self.imported = 0
+        self.skipped = 0
+        file_format = options['format'] or (
+            'csv' if options['path'].endswith('.csv') else 'jsonl'
+        )
+        import_batch = getattr(self, f'import_{options["kind"]}')
+        start = time.monotonic()
+        stream = self.open(options['path'])
+        try:
+            rows = read_rows(stream, file_format)
+            for batch in batches(rows, options['batch_size']):
+                with transaction.atomic():
+                    import_batch(batch)
+                self.stderr.write(
+                    f'Загружено: {self.imported}, пропущено: {self.skipped}'
+                )
+            loaded = time.monotonic() - start
+        except (ValueError, KeyError, OSError, csv.Error,
+                IntegrityError) as error:
+            raise CommandError(
+                f'Ошибка в данных после {self.imported} строк: {error!r}'
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            # Пачки до ошибки уже закоммичены, их тоже нужно обслужить
+            if self.imported:
+                self.reset_sequences()
+                if not options['skip_maintenance']:
+                    self.maintain()
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено: {self.imported}, пропущено: {self.skipped}, '
+            f'{self.imported / max(loaded, 1e-9):.0f} строк/с, '
+            f'всего {elapsed:.1f} с'
+        ))
+
+    def open(self, path):
+        if path == '-':
+            return sys.stdin
+        try:
+            return open(path, encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+
+    def resolve_users(self, usernames):
+        """id пользователей по именам, неизвестные берутся из базы"""
+        missing = set(usernames) - self.users.keys() - {None, ''}
+        if not missing:
+            return
+        self.users.update(
+            User.objects.filter(username__in=missing)
+            .values_list('username', 'pk')
+        )
+        missing -= self.users.keys()
+        if missing and self.options['create_users']:
+            # Без пароля: войти можно будет после его сброса
+            password = make_password(None)
+            User.objects.bulk_create(
+                [User(username=name, password=password)
+                 for name in sorted(missing)],
+                ignore_conflicts=True,
+            )
+            self.users.update(
+                User.objects.filter(username__in=missing)
+                .values_list('username', 'pk')
+            )
+
+    def resolve_groups(self, slugs):
+        missing = set(slugs) - self.groups.keys() - {None, ''}
+        if not missing:
+            return
+        self.groups.update(
+            Group.objects.filter(slug__in=missing).values_list('slug', 'pk')
+        )
+        missing -= self.groups.keys()
+        if missing and self.options['create_groups']:
+            Group.objects.bulk_create(
+                [Group(title=slug, slug=slug) for slug in sorted(missing)],
+                ignore_conflicts=True,
+            )
+            self.groups.update(
+                Group.objects.filter(slug__in=missing)
+                .values_list('slug', 'pk')
+            )
+
+    def copy_image(self, path):
+        """Сохранить картинку в MEDIA_ROOT/posts/, вернуть имя и размеры.
+
+        Картинка проходит тот же путь, что и загрузка через форму:
+        ограничение размера и пережатие posts.images.normalize. Путь
+        не должен выходить из каталога --images. Без --images путь
+        считается уже лежащим в хранилище, и размеры не читаются.
+        """
+        if not path or not self.options['images']:
+            return path or None, (None, None)
+        root = os.path.realpath(self.options['images'])
+        source = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, source]) != root:
+            raise ValueError(f'Картинка вне каталога --images: {path}')
+        if os.path.getsize(source) > get_upload_max_size():
+            raise ValueError(f'Картинка больше допустимого: {path}')
+        with open(source, 'rb') as file:
+            image = images.normalize(File(file, name=source))
+        size = get_image_dimensions(image)
+        name = os.path.join('posts', image.name)
+        return default_storage.save(name, image), size
+
+    def import_posts(self, rows):
+        self.resolve_users(row['author'] for row in rows)
+        self.resolve_groups(row.get('group') for row in rows)
+        posts = []
+        for row in rows:
+            author_id = self.users.get(row['author'])
+            if author_id is None:
+                self.skipped += 1
+                continue
+            image, (width, height) = self.copy_image(row.get('image'))
+            posts.append(Post(
+                id=parse_id(row.get('id')),
+                text=row['text'],
+                pub_date=parse_date(row.get('pub_date')),
+                author_id=author_id,
+                group_id=self.groups.get(row.get('group')),
+                image=image,
+                image_width=width,
+                image_height=height,
+            ))
+            self.affected_users.add(author_id)
+        bulk_create_dated(Post, posts, 'pub_date')
+        self.imported += len(posts)
+
+    def import_comments(self, rows):
+        self.resolve_users(row['author'] for row in rows)
+        post_ids = {parse_id(row['post']) for row in rows}
+        existing = set(
+            Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True)
+        )
+        comments = []
+        for row in rows:
+            author_id = self.users.get(row['author'])
+            post_id = parse_id(row['post'])
+            if author_id is None or post_id not in existing:
+                self.skipped += 1
+                continue
+            comments.append(Comment(
+                id=parse_id(row.get('id')),
+                post_id=post_id,
+                author_id=author_id,
+                text=row['text'],
+                created=parse_date(row.get('created')),
+            ))
+        bulk_create_dated(Comment, comments, 'created')
+        self.imported += len(comments)
+
+    def import_follows(self, rows):
+        self.resolve_users(
+            name for row in rows for name in (row['user'], row['author'])
+        )
+        follows = []
+        for row in rows:
+            user_id = self.users.get(row['user'])
+            author_id = self.users.get(row['author'])
+            if user_id is None or author_id is None or user_id == author_id:
+                self.skipped += 1
+                continue
+            follows.append(Follow(user_id=user_id, author_id=author_id))
+            self.affected_users.add(user_id)
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.imported += len(follows)
+
+    def reset_sequences(self):
+        """Строки с явными id не двигают последовательности в PostgreSQL"""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Post, Comment]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def maintain(self):
+        """Счетчики, ленты и поиск, которые bulk_create не обновляет"""
+        self.stderr.write('Пересчет счетчиков, лент и поискового индекса')
+        counters.recount_users()
+        counters.recount_posts()
+        counters.recount_groups()
+        if self.options['kind'] == 'posts':
+            followers = Follow.objects.filter(
+                author_id__in=self.affected_users
+            ).values_list('user_id', flat=True).distinct()
+            feed_users = set(followers)
+        else:
+            feed_users = self.affected_users
+        for user_id in sorted(feed_users):
+            feed.rebuild(user_id)
+        if self.options['kind'] == 'posts':
+            search.rebuild()
+            if self.options['images']:
+                self.stderr.write(
+                    'Миниатюры можно создать командой warm_thumbnails'
+                )
@@ -0,0 +1,218 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts import cards, counters, feed, search
+from posts.bulk import bulk_create_dated
+from posts.models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 500
+
+
+def skewed_weights(size, exponent):
+    """Накопленные веса по закону Ципфа: первые элементы выпадают чаще.
+
+    С накопленными весами random.choices ищет элемент бинарным поиском,
+    а не суммирует все веса при каждом вызове.
+    """
+    return list(accumulate(
+        1 / (rank ** exponent) for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней в прошлое раскидать даты публикаций'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для активности авторов'
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс имен пользователей и адресов групп'
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix}_ уже есть, '
+                'укажите другой --prefix'
+            )
+        with transaction.atomic():
+            user_ids = self.create_users(prefix, options['users'])
+            group_ids = self.create_groups(prefix, options['groups'])
+            posts = self.create_posts(
+                user_ids, group_ids, options['posts'],
+                options['days'], options['skew'],
+            )
+            self.create_comments(
+                user_ids, posts, options['comments'], options['skew']
+            )
+            follows = self.create_follows(
+                user_ids, options['follows'], options['skew']
+            )
+        self.stdout.write('Пересчет счетчиков, лент и поискового индекса')
+        counters.recount_users()
+        counters.recount_posts()
+        counters.recount_groups()
+        for user_id in sorted({user_id for user_id, _ in follows}):
+            feed.rebuild(user_id)
+        search.rebuild()
+        cards.bump_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'групп: {len(group_ids)}, постов: {len(posts)}, '
+            f'комментариев: {options["comments"]}, подписок: {len(follows)}'
+        ))
+
+    def create_users(self, prefix, amount):
+        # Хешировать пароль для каждого пользователя слишком долго
+        password = make_password('password')
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'{prefix}_{number}',
+                    first_name=self.fake.first_name(),
+                    last_name=self.fake.last_name(),
+                    password=password,
+                )
+                for number in range(amount)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        # SQLite не возвращает id после bulk_create, поэтому перечитываем.
+        # Порядок id задает "популярность" пользователя в распределениях
+        return list(
+            User.objects.filter(username__startswith=f'{prefix}_')
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def create_groups(self, prefix, amount):
+        Group.objects.bulk_create(
+            [
+                Group(
+                    title=self.fake.sentence(nb_words=3).rstrip('.'),
+                    slug=f'{prefix}-{number}',
+                    description=self.fake.paragraph(),
+                )
+                for number in range(amount)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        return list(
+            Group.objects.filter(slug__startswith=f'{prefix}-')
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def create_posts(self, user_ids, group_ids, amount, days, skew):
+        if not user_ids or not amount:
+            return []
+        now = timezone.now()
+        authors = self.random.choices(
+            user_ids, cum_weights=skewed_weights(len(user_ids), skew),
+            k=amount,
+        )
+        groups = [None] * amount
+        if group_ids:
+            groups = self.random.choices(
+                group_ids, cum_weights=skewed_weights(len(group_ids), 1.0),
+                k=amount,
+            )
+        start_id = (Post.objects.order_by('-pk')
+                    .values_list('pk', flat=True).first() or 0) + 1
+        # Посты создаются в порядке дат, как на живом сайте
+        dates = sorted(
+            now - timedelta(seconds=self.random.uniform(0, days * 86400))
+            for _ in range(amount)
+        )
+        posts = []
+        rows = zip(authors, groups, dates)
+        for offset, (author_id, group_id, pub_date) in enumerate(rows):
+            # Примерно треть постов публикуется без группы
+            if self.random.random() < 0.3:
+                group_id = None
+            posts.append(Post(
+                id=start_id + offset,
+                text=self.fake.paragraph(
+                    nb_sentences=self.random.randint(1, 8)
+                ),
+                author_id=author_id,
+                group_id=group_id,
+                pub_date=pub_date,
+            ))
+        bulk_create_dated(Post, posts, 'pub_date', BATCH_SIZE)
+        return [(post.pk, post.pub_date) for post in posts]
+
+    def create_comments(self, user_ids, posts, amount, skew):
+        if not user_ids or not posts or not amount:
+            return
+        now = timezone.now()
+        # Обсуждают в основном свежие посты и пишут активные авторы
+        targets = self.random.choices(
+            posts[::-1], cum_weights=skewed_weights(len(posts), skew),
+            k=amount,
+        )
+        authors = self.random.choices(
+            user_ids, cum_weights=skewed_weights(len(user_ids), skew),
+            k=amount,
+        )
+        comments = []
+        for (post_id, pub_date), author_id in zip(targets, authors):
+            delay = timedelta(seconds=self.random.expovariate(1 / 3600))
+            comments.append(Comment(
+                post_id=post_id,
+                author_id=author_id,
+                text=self.fake.sentence(),
+                created=min(pub_date + delay, now),
+            ))
+            if len(comments) == BATCH_SIZE:
+                bulk_create_dated(Comment, comments, 'created')
+                comments = []
+        bulk_create_dated(Comment, comments, 'created')
+
+    def create_follows(self, user_ids, amount, skew):
+        if len(user_ids) < 2:
+            return set()
+        # Подписываются в основном на популярных авторов. Не больше
+        # половины возможных пар, иначе дубли почти не дают новых подписок
+        amount = min(amount, len(user_ids) * (len(user_ids) - 1) // 2)
+        author_weights = skewed_weights(len(user_ids), skew)
+        follows = set()
+        while len(follows) < amount:
+            user_id = self.random.choice(user_ids)
+            author_id = self.random.choices(
+                user_ids, cum_weights=author_weights
+            )[0]
+            if user_id != author_id:
+                follows.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            [
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, author_id in follows
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return follows
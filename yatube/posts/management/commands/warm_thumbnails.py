@@ -0,0 +1,45 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры для всех картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Количество потоков для генерации'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        posts = (
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by('pk').only('pk', 'image', 'author_id', 'group_id')
+        )
+        done = failed = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for post in posts.iterator():
+                # Держим ограниченное число задач, чтобы не копить
+                # в памяти future для каждой картинки
+                if len(pending) >= workers * 4:
+                    finished, pending = wait(
+                        pending, return_when=FIRST_COMPLETED
+                    )
+                    for future in finished:
+                        done += 1
+                        failed += not future.result()
+                pending.add(
+                    executor.submit(thumbnails.generate_in_worker, post)
+                )
+            for future in wait(pending).done:
+                done += 1
+                failed += not future.result()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {done}, с ошибками: {failed}'
+        ))
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:59
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Substr
+import django.db.models.deletion
+
+PREVIEW_LENGTH = 200
+
+
+def fill_group_stats(apps, schema_editor):
+    """Собрать сводку для уже существующих групп"""
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupStats.objects.bulk_create(
+        [GroupStats(group_id=pk) for pk in Group.objects.values_list(
+            'pk', flat=True)],
+        batch_size=500,
+    )
+    posts = Post.objects.filter(group=OuterRef('pk')).order_by('-pub_date',
+                                                               '-id')
+    GroupStats.objects.update(
+        posts_count=Coalesce(
+            Subquery(
+                Post.objects.filter(group=OuterRef('pk'))
+                .order_by()
+                .values('group')
+                .annotate(total=Count('pk'))
+                .values('total'),
+                output_field=IntegerField(),
+            ),
+            0,
+        ),
+        last_post=Subquery(posts.values('id')[:1]),
+        last_post_date=Subquery(posts.values('pub_date')[:1]),
+        last_post_text=Coalesce(
+            Substr(Subquery(posts.values('text')[:1]), 1, PREVIEW_LENGTH),
+            models.Value(''),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_auto_20261018_1938'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Количество постов')),
+                ('last_post_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата последнего поста')),
+                ('last_post_text', models.CharField(blank=True, max_length=200, verbose_name='Начало последнего поста')),
+                ('last_post', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.Post', verbose_name='Последний пост')),
+            ],
+            options={
+                'verbose_name': 'Сводка группы',
+                'verbose_name_plural': 'Сводки групп',
+            },
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
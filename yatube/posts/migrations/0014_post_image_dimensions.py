@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:02
+
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def fill_image_dimensions(apps, schema_editor):
+    """Размеры уже загруженных картинок, пропавшие файлы пропускаются"""
+    Post = apps.get_model('posts', 'Post')
+    posts = (
+        Post.objects.filter(image_width__isnull=True)
+        .exclude(image='').exclude(image__isnull=True)
+        .values_list('id', 'image')
+    )
+    for post_id, name in posts.iterator():
+        try:
+            with default_storage.open(name) as image:
+                width, height = get_image_dimensions(image)
+        except OSError:
+            continue
+        if width and height:
+            Post.objects.filter(id=post_id).update(
+                image_width=width, image_height=height
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_groupstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(fill_image_dimensions, migrations.RunPython.noop),
+    ]
@@ -22,6 +22,14 @@ class Post(models.Model):
         blank=True,
         null=True,
     )
+    # Размеры заполняет PostForm при загрузке. Через width_field ImageField
+    # читал бы файл при каждой выборке строки без размеров
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False,
+    )
     group = models.ForeignKey(
         'Group',
         blank=True,
@@ -31,11 +39,26 @@ class Post(models.Model):
         verbose_name='Группа',
         help_text='Группа, к которой будет относиться пост'
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты читаются по (pub_date, id) в обратном порядке, SQLite
+        # проходит эти индексы с конца без отдельной сортировки
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -76,6 +99,10 @@ class Comment(models.Model):
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [models.Index(
+            fields=['post', 'created', 'id'],
+            name='comment_post_created_idx'
+        )]
 
     def __str__(self) -> str:
         return self.text[:20]
@@ -102,6 +129,138 @@ class Follow(models.Model):
             fields=['user', 'author'],
             name='unique_names'
         )]
+        indexes = [models.Index(
+            fields=['author', 'user'],
+            name='follow_author_user_idx'
+        )]
 
     def __str__(self):
         return f'{self.user} - {self.author}'
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя, которые обновляются вместе с данными"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField('Количество постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        'Количество подписок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class GroupStats(models.Model):
+    """Сводка группы для каталога: число постов и последний пост"""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа',
+    )
+    posts_count = models.PositiveIntegerField('Количество постов', default=0)
+    # Без ограничения в базе и без каскада: удаление поста не ищет
+    # ссылки на него, сводку обновляет сигнал
+    last_post = models.ForeignKey(
+        Post,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        verbose_name='Последний пост',
+    )
+    last_post_date = models.DateTimeField(
+        'Дата последнего поста',
+        null=True,
+        blank=True,
+    )
+    last_post_text = models.CharField(
+        'Начало последнего поста',
+        max_length=200,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Сводка группы'
+        verbose_name_plural = 'Сводки групп'
+
+    def __str__(self):
+        return str(self.group)
+
+
+class FeedEntry(models.Model):
+    """Запись во входящей ленте подписчика (fan-out on write)"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'post'],
+            name='unique_feed_entry'
+        )]
+        indexes = [models.Index(
+            fields=['user', 'pub_date', 'post'],
+            name='feed_user_pub_date_idx'
+        )]
+
+    def __str__(self):
+        return f'{self.user} - {self.post_id}'
+
+
+class SearchTerm(models.Model):
+    """Инвертированный индекс поиска для баз без FTS5"""
+    term = models.CharField('Слово', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name='Пост',
+    )
+    weight = models.FloatField('Вес')
+
+    class Meta:
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+        constraints = [models.UniqueConstraint(
+            fields=['term', 'post'],
+            name='unique_search_term'
+        )]
+
+    def __str__(self):
+        return f'{self.term} - {self.post_id}'
@@ -0,0 +1,197 @@
+"""Кеш лент на страницах index, group_posts и profile.
+
+Кешируется только тело ленты - карточки постов и пагинатор, шапка с
+именем пользователя и кнопкой подписки рендерится на каждый запрос.
+Ключ фрагмента содержит поколения затронутых областей (главная, группа,
+профиль автора). Сигналы меняют поколения при сохранении и удалении
+постов, комментариев, групп и авторов, поэтому сбрасываются ровно
+затронутые страницы, а старые фрагменты вытесняются сами.
+
+Поколение - это время последнего изменения области в наносекундах,
+поэтому из тех же поколений строятся валидаторы ETag и Last-Modified
+для условных GET-запросов.
+"""
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+
+PAGE_TIMEOUT: int = 60 * 60
+# Параметры запроса, от которых зависит содержимое ленты
+PAGE_PARAMS = ('page', 'after', 'before', 'last')
+# Область всех страниц: сбрасывается после массовых пересчетов
+ALL_SCOPE = 'all'
+
+
+def _generation_key(scope):
+    return f'gen:{scope}'
+
+
+def index_scope():
+    return 'index'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def profile_scope(user_id):
+    return f'profile:{user_id}'
+
+
+def post_scope(post_id):
+    """Страница поста и ее комментарии"""
+    return f'post:{post_id}'
+
+
+def follows_scope(user_id):
+    """Подписчики и подписки пользователя в шапке профиля"""
+    return f'follows:{user_id}'
+
+
+def post_scopes(author_id, *group_ids):
+    """Страницы, на которых показан пост"""
+    scopes = {index_scope(), profile_scope(author_id)}
+    scopes.update(group_scope(pk) for pk in group_ids if pk)
+    return scopes
+
+
+def _bump(scopes):
+    now = time.time_ns()
+    cache.set_many({_generation_key(scope): now for scope in scopes}, None)
+
+
+def invalidate(scopes):
+    """Сбросить кеш страниц областей.
+
+    Поколения меняются сразу и еще раз после коммита: иначе запрос,
+    прочитавший данные до коммита, мог бы сохранить старую ленту
+    под уже новым поколением.
+    """
+    scopes = set(scopes)
+    if not scopes:
+        return
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def invalidate_all():
+    invalidate([ALL_SCOPE])
+
+
+def _generations(scopes):
+    keys = [_generation_key(scope) for scope in (ALL_SCOPE, *scopes)]
+    generations = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in generations}
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def fragment_key(request, view_name, scopes):
+    params = sorted(
+        (name, request.GET[name])
+        for name in PAGE_PARAMS if name in request.GET
+    )
+    parts = [
+        view_name,
+        get_language() or '',
+        str(request.user.is_authenticated),
+        repr(params),
+        # Поколения, сброшенные вместе, совпадают, поэтому в ключе
+        # нужны и сами области
+        *(f'{scope}={generation}' for scope, generation
+          in zip((ALL_SCOPE, *scopes), _generations(scopes))),
+    ]
+    digest = hashlib.md5(':'.join(parts).encode()).hexdigest()
+    return f'feed_page:{digest}'
+
+
+def feed_html(request, view_name, scopes, page_obj,
+              card_template='posts/includes/post_item.html',
+              separator='<hr>'):
+    """Html ленты из кеша или отрендеренный заново.
+
+    page_obj стоит передавать ленивым: на попадании в кеш запрос
+    к постам не выполняется.
+    """
+    key = fragment_key(request, view_name, scopes)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(
+            'posts/includes/feed.html',
+            {
+                'page_obj': page_obj,
+                'card_template': card_template,
+                'separator': separator,
+            },
+            request,
+        )
+        cache.set(key, html, PAGE_TIMEOUT)
+    return mark_safe(html)
+
+
+def conditional(scopes_func):
+    """Декоратор условного GET для страницы, показывающей области.
+
+    scopes_func(request, **kwargs) возвращает области страницы или None,
+    если объекта нет - тогда валидаторов нет и вьюха отдаст 404.
+    ETag учитывает пользователя, поэтому верен и для кнопок подписки и
+    редактирования, а у вошедшего - еще и секрет CSRF: после нового входа
+    секрет меняется, и страница с формой не отдается из кеша браузера со
+    старым токеном. Last-Modified не знает о пользователе и отдается
+    только анонимам.
+    """
+    def get_generations(request, **kwargs):
+        if not hasattr(request, '_page_generations'):
+            scopes = scopes_func(request, **kwargs)
+            request._page_generations = (
+                None if scopes is None
+                else list(zip((ALL_SCOPE, *scopes), _generations(scopes)))
+            )
+        return request._page_generations
+
+    def etag(request, *args, **kwargs):
+        generations = get_generations(request, **kwargs)
+        if generations is None:
+            return None
+        user = request.user
+        if user.is_authenticated:
+            # get_token создает секрет, если его еще нет, - тот же,
+            # что попадет в формы страницы и в куку
+            get_token(request)
+            visitor = (f'{user.pk}:{user.get_username()}:'
+                       f'{request.META["CSRF_COOKIE"]}')
+        else:
+            visitor = 'anonymous'
+        parts = [
+            request.resolver_match.view_name,
+            get_language() or '',
+            visitor,
+            *(f'{scope}={generation}' for scope, generation in generations),
+        ]
+        return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        generations = get_generations(request, **kwargs)
+        if generations is None:
+            return None
+        # Заголовок хранит целые секунды, округляем вверх. Точный
+        # валидатор - ETag: при If-None-Match дата не проверяется
+        latest = max(generation for _, generation in generations)
+        return datetime.fromtimestamp(
+            math.ceil(latest / 10 ** 9), tz=timezone.utc
+        )
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
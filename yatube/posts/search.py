@@ -0,0 +1,222 @@
+"""Полнотекстовый поиск по постам.
+
+Индексируются текст поста, название группы и имя автора. На SQLite с
+FTS5 используется виртуальная таблица posts_post_fts с ранжированием
+bm25, на остальных базах - таблица SearchTerm, которую наполняет и
+читает Python. Индекс обновляется сигналами при сохранении и удалении
+постов, групп и пользователей.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Post, SearchTerm
+
+FTS_TABLE = 'posts_post_fts'
+# Во сколько раз совпадение в поле важнее совпадения в имени автора
+TEXT_WEIGHT: float = 4.0
+GROUP_WEIGHT: float = 2.0
+AUTHOR_WEIGHT: float = 1.0
+# Сколько лучших результатов отдает поиск
+SEARCH_LIMIT: int = 1000
+BATCH_SIZE: int = 500
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word[:64] for word in _WORD.findall((text or '').lower())]
+
+
+def _documents(posts):
+    """Поля индекса для каждого поста: текст, группа и автор"""
+    for post in posts:
+        author = post.author
+        yield post.pk, (
+            post.text,
+            post.group.title if post.group_id else '',
+            ' '.join(filter(None, (
+                author.username, author.first_name, author.last_name
+            ))),
+        )
+
+
+class Fts5Index:
+    """Индекс на виртуальной таблице FTS5"""
+
+    def __init__(self, alias):
+        self.connection = connections[alias]
+
+    def update(self, posts):
+        rows = [(pk, *fields) for pk, fields in _documents(posts)]
+        if not rows:
+            return
+        # REPLACE заменяет прежнюю строку поста, отдельный DELETE не нужен
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} '
+                '(rowid, text, group_title, author) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+                f'({", ".join(["%s"] * len(post_ids))})',
+                post_ids,
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        words = tokenize(query)
+        if not words:
+            return []
+        match = ' '.join(f'"{word}"*' for word in words)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s',
+                [match, TEXT_WEIGHT, GROUP_WEIGHT, AUTHOR_WEIGHT, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PythonIndex:
+    """Инвертированный индекс в таблице SearchTerm.
+
+    Вес слова в посте - сумма весов полей, где оно встретилось.
+    Слово запроса, как и в FTS5, ищется по префиксу: вес поста для него -
+    сумма весов слов поста с этим началом. Ранжирование - сумма
+    вес * idf по словам запроса, ищутся только посты, в которых нашлись
+    все слова запроса.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def update(self, posts):
+        documents = list(_documents(posts))
+        if not documents:
+            return
+        self.remove([pk for pk, _ in documents])
+        terms = []
+        for pk, (text, group_title, author) in documents:
+            weights = Counter()
+            for field, weight in ((text, TEXT_WEIGHT),
+                                  (group_title, GROUP_WEIGHT),
+                                  (author, AUTHOR_WEIGHT)):
+                for word in tokenize(field):
+                    weights[word] += weight
+            terms.extend(
+                SearchTerm(term=term, post_id=pk, weight=weight)
+                for term, weight in weights.items()
+            )
+        SearchTerm.objects.using(self.alias).bulk_create(
+            terms, batch_size=BATCH_SIZE
+        )
+
+    def remove(self, post_ids):
+        SearchTerm.objects.using(self.alias).filter(
+            post_id__in=list(post_ids)
+        ).delete()
+
+    def clear(self):
+        SearchTerm.objects.using(self.alias).all().delete()
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        words = set(tokenize(query))
+        if not words:
+            return []
+        condition = Q()
+        for word in words:
+            condition |= Q(term__startswith=word)
+        rows = SearchTerm.objects.using(self.alias).filter(
+            condition
+        ).values_list('term', 'post_id', 'weight')
+        postings = defaultdict(lambda: defaultdict(float))
+        for term, post_id, weight in rows.iterator():
+            for word in words:
+                if term.startswith(word):
+                    postings[word][post_id] += weight
+        if len(postings) < len(words):
+            return []
+        total = Post.objects.using(self.alias).count() or 1
+        scores = None
+        for term, posts in postings.items():
+            idf = math.log(1 + total / len(posts))
+            term_scores = {pk: weight * idf for pk, weight in posts.items()}
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    pk: score + term_scores[pk]
+                    for pk, score in scores.items() if pk in term_scores
+                }
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [pk for pk, _ in ranked[:limit]]
+
+
+_fts_available = {}
+
+
+def has_fts5(alias):
+    """Есть ли в базе таблица FTS5 (создается миграцией только на SQLite)"""
+    if alias not in _fts_available:
+        connection = connections[alias]
+        _fts_available[alias] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[alias]
+
+
+def get_index(for_write=False):
+    if for_write:
+        alias = router.db_for_write(Post)
+    else:
+        alias = router.db_for_read(Post)
+    alias = alias or 'default'
+    return Fts5Index(alias) if has_fts5(alias) else PythonIndex(alias)
+
+
+def index_posts(posts):
+    """Переиндексировать посты (queryset или список)"""
+    if hasattr(posts, 'select_related'):
+        posts = posts.select_related('author', 'group')
+    get_index(for_write=True).update(posts)
+
+
+def remove_posts(post_ids):
+    get_index(for_write=True).remove(post_ids)
+
+
+def search(query, limit=SEARCH_LIMIT):
+    """id постов по убыванию релевантности"""
+    return get_index().search(query, limit)
+
+
+def rebuild():
+    """Построить индекс заново по всем постам"""
+    index = get_index(for_write=True)
+    index.clear()
+    posts = Post.objects.select_related('author', 'group').order_by('pk')
+    batch = []
+    indexed = 0
+    for post in posts.iterator(chunk_size=BATCH_SIZE):
+        batch.append(post)
+        if len(batch) == BATCH_SIZE:
+            index.update(batch)
+            indexed += len(batch)
+            batch = []
+    index.update(batch)
+    return indexed + len(batch)
@@ -0,0 +1,204 @@
+import threading
+
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import (cards, counters, events, feed, follow_graph, page_cache,
+               search)
+from .models import (Comment, Follow, Group, GroupStats, Post, User,
+                     UserStats)
+
+
+# Посты, которые сейчас удаляются в этом потоке. Их комментарии
+# удаляются каскадом, и пересчитывать пост ради каждого не нужно
+_deleting = threading.local()
+
+
+def deleting_post_ids():
+    if not hasattr(_deleting, 'post_ids'):
+        _deleting.post_ids = set()
+    return _deleting.post_ids
+
+
+def is_login_update(update_fields):
+    """Сохранение пользователя при входе меняет только last_login"""
+    return update_fields is not None and set(update_fields) == {'last_login'}
+
+
+def comment_scopes(comment):
+    """Страницы с постом комментария: на карточке есть число комментариев"""
+    if Comment.post.is_cached(comment):
+        post = comment.post
+        return page_cache.post_scopes(post.author_id, post.group_id) | {
+            page_cache.post_scope(post.pk)
+        }
+    row = Post.objects.filter(pk=comment.post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    if row is None:
+        return set()
+    return page_cache.post_scopes(*row) | {
+        page_cache.post_scope(comment.post_id)
+    }
+
+
+def authors_scopes(posts):
+    """Профили авторов постов и главная страница"""
+    author_ids = posts.order_by().values_list('author_id', flat=True)
+    return {page_cache.index_scope()} | {
+        page_cache.profile_scope(pk) for pk in author_ids.distinct()
+    }
+
+
+def follows_scopes(follow):
+    """Шапки профилей автора и подписчика, в том числе кнопка подписки"""
+    return {
+        page_cache.follows_scope(follow.author_id),
+        page_cache.follows_scope(follow.user_id),
+    }
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Группа до изменения, чтобы сбросить страницу и старой группы.
+    # Через __dict__, чтобы отложенное поле не вызывало запрос
+    instance._initial_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    cards.bump('post', instance.pk)
+    page_cache.invalidate(page_cache.post_scopes(
+        instance.author_id, instance.group_id, instance._initial_group_id
+    ) | {page_cache.post_scope(instance.pk)})
+    old_group_id = instance._initial_group_id
+    instance._initial_group_id = instance.group_id
+    if raw:
+        return
+    # Автор и группа обычно уже загружены вьюхой, повторный запрос не нужен
+    if Post.author.is_cached(instance) and (
+        not instance.group_id or Post.group.is_cached(instance)
+    ):
+        search.index_posts([instance])
+    else:
+        search.index_posts(Post.objects.filter(pk=instance.pk))
+    counters.move_group_post(instance, old_group_id, created)
+    if created:
+        counters.change_user(instance.author_id, 'posts_count', 1)
+        feed.fan_out(instance)
+        events.publish_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_post_ids().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_post_ids().discard(instance.pk)
+    cards.bump('post', instance.pk)
+    page_cache.invalidate(page_cache.post_scopes(
+        instance.author_id, instance.group_id
+    ) | {page_cache.post_scope(instance.pk)})
+    counters.change_user(instance.author_id, 'posts_count', -1)
+    if instance.group_id:
+        counters.remove_group_post(instance.group_id, instance.pk)
+    search.remove_posts([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post(instance.post_id, 1)
+        cards.bump('post', instance.post_id)
+        page_cache.invalidate(comment_scopes(instance))
+        events.publish_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # Страницы удаляемого поста сбросит post_deleted
+    if instance.post_id in deleting_post_ids():
+        return
+    counters.change_post(instance.post_id, -1)
+    cards.bump('post', instance.post_id)
+    page_cache.invalidate(comment_scopes(instance))
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    cards.bump('group', instance.pk)
+    if created and not raw:
+        GroupStats.objects.get_or_create(group=instance)
+    if not created and not raw:
+        search.index_posts(instance.posts.all())
+        page_cache.invalidate(
+            authors_scopes(instance.posts.all())
+            | {page_cache.group_scope(instance.pk)}
+        )
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    instance._post_ids = list(instance.posts.values_list('pk', flat=True))
+    instance._page_scopes = authors_scopes(instance.posts.all())
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    cards.bump('group', instance.pk)
+    search.index_posts(Post.objects.filter(pk__in=instance._post_ids))
+    page_cache.invalidate(
+        instance._page_scopes | {page_cache.group_scope(instance.pk)}
+    )
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if not is_login_update(update_fields):
+        cards.bump('user', instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, raw=False, update_fields=None,
+                 **kwargs):
+    if not created and not raw and not is_login_update(update_fields):
+        search.index_posts(instance.posts.all())
+        group_ids = instance.posts.order_by().values_list(
+            'group_id', flat=True
+        ).distinct()
+        # Имя автора комментария показано на странице поста
+        commented_ids = Comment.objects.filter(author=instance).order_by(
+        ).values_list('post_id', flat=True).distinct()
+        page_cache.invalidate(
+            page_cache.post_scopes(instance.pk, *group_ids)
+            | {page_cache.post_scope(pk) for pk in commented_ids}
+        )
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.user_id and instance.author_id:
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+        follow_graph.add(instance.user_id, instance.author_id)
+        feed.backfill(instance.user_id, instance.author_id)
+        page_cache.invalidate(follows_scopes(instance))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    if instance.user_id and instance.author_id:
+        counters.change_user(instance.author_id, 'followers_count', -1)
+        counters.change_user(instance.user_id, 'following_count', -1)
+        follow_graph.remove(instance.user_id, instance.author_id)
+        feed.prune(instance.user_id, instance.author_id)
+        page_cache.invalidate(follows_scopes(instance))
@@ -1,10 +1,237 @@
-from django.core.paginator import Paginator
+import base64
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
 
 AMT_POSTS: str = 10
+AMT_COMMENTS: int = 20
+# Сколько номеров страниц показывать по обе стороны от текущей
+PAGE_WINDOW: int = 3
+
+
+class InvalidCursor(Exception):
+    """Курсор из запроса не удалось разобрать"""
+
+
+class OffsetPage(Page):
+    """Страница старого формата ?page=N с ограниченным окном номеров"""
+    is_cursor = False
+
+    @property
+    def next_query(self):
+        return f'page={self.next_page_number()}'
+
+    @property
+    def previous_query(self):
+        return f'page={self.previous_page_number()}'
+
+    @property
+    def first_query(self):
+        return 'page=1'
+
+    @property
+    def last_query(self):
+        return f'page={self.paginator.num_pages}'
+
+    @property
+    def page_window(self):
+        start = max(self.number - PAGE_WINDOW, 1)
+        end = min(self.number + PAGE_WINDOW, self.paginator.num_pages)
+        return range(start, end + 1)
+
+
+class OffsetPaginator(Paginator):
+    def _get_page(self, *args, **kwargs):
+        return OffsetPage(*args, **kwargs)
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации.
+
+    Повторяет интерфейс django Page, которым пользуются шаблоны,
+    но не знает общего количества объектов и номера страницы.
+    """
+    is_cursor = True
+    page_window = ()
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # Курсоры считаем сразу: вьюха может заменить object_list,
+        # например, подставить посты вместо записей ленты
+        self._first_token = (
+            paginator.encode(object_list[0]) if object_list else ''
+        )
+        self._last_token = (
+            paginator.encode(object_list[-1]) if object_list else ''
+        )
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_query(self):
+        return 'after=' + self._last_token
+
+    @property
+    def previous_query(self):
+        return 'before=' + self._first_token
+
+    @property
+    def first_query(self):
+        return ''
+
+    @property
+    def last_query(self):
+        return 'last=1'
+
+
+class CursorPaginator:
+    """Пагинация по ключу (keyset) вместо OFFSET.
+
+    Объекты упорядочены по паре полей keys, вторым полем должен идти
+    уникальный столбец. Курсор - непрозрачный токен со значениями ключа
+    крайнего объекта страницы, поэтому каждая страница - это один
+    запрос по индексу без COUNT(*) и без пропуска строк.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 descending=True):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.keys = keys
+        self.descending = descending
+
+    @cached_property
+    def count(self):
+        """Общее количество объектов, считается только по требованию"""
+        return self.object_list.count()
+
+    def encode(self, obj):
+        values = [
+            self._field(key).value_to_string(obj) for key in self.keys
+        ]
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            values = json.loads(raw.decode())
+            if len(values) != len(self.keys):
+                raise InvalidCursor(token)
+            values = [
+                self._field(key).to_python(value)
+                for key, value in zip(self.keys, values)
+            ]
+        except (ValueError, TypeError, ValidationError) as error:
+            raise InvalidCursor(token) from error
+        # По None нельзя сравнивать в запросе, такой курсор не выдается
+        if None in values:
+            raise InvalidCursor(token)
+        return values
+
+    def first_page(self):
+        return self._page(self._ordered(reverse=False), has_previous=False)
+
+    def last_page(self):
+        rows = list(self._ordered(reverse=True)[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self, has_next=False,
+                          has_previous=has_previous)
+
+    def page_after(self, token):
+        queryset = self._ordered(reverse=False).filter(
+            self._beyond(self.decode(token), reverse=False)
+        )
+        page = self._page(queryset, has_previous=True)
+        # Курсор указывает за конец ленты - показываем последнюю страницу
+        return page if page.object_list else self.last_page()
+
+    def page_before(self, token):
+        queryset = self._ordered(reverse=True).filter(
+            self._beyond(self.decode(token), reverse=True)
+        )
+        rows = list(queryset[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        if not rows:
+            return self.first_page()
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self, has_next=True,
+                          has_previous=has_previous)
+
+    def _page(self, queryset, has_previous):
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], self, has_next=has_next,
+                          has_previous=has_previous)
+
+    def _field(self, key):
+        return self.object_list.model._meta.get_field(key)
+
+    def _ordered(self, reverse):
+        prefix = '-' if self.descending != reverse else ''
+        return self.object_list.order_by(
+            *[prefix + key for key in self.keys]
+        )
+
+    def _beyond(self, values, reverse):
+        """Условие "строго после курсора" в выбранном направлении"""
+        lookup = 'lt' if self.descending != reverse else 'gt'
+        first, second = self.keys
+        first_value, second_value = values
+        return (
+            Q(**{f'{first}__{lookup}': first_value})
+            | Q(**{first: first_value, f'{second}__{lookup}': second_value})
+        )
+
 
+def paginator(request, posts, keys=('pub_date', 'id'), descending=True,
+              per_page=AMT_POSTS, legacy_pages=True):
+    """Страница объектов для ленты.
 
-def paginator(request, posts):
-    paginator = Paginator(posts, AMT_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    Старые ссылки вида ?page=N обслуживает обычный Paginator,
+    всё остальное - курсорная пагинация по ?after= / ?before=.
+    С legacy_pages=False ?page= не учитывается: у новых адресов старых
+    ссылок нет, а Paginator стоит лишнего COUNT(*).
+    """
+    page_number = request.GET.get('page') if legacy_pages else None
+    if page_number is not None:
+        prefix = '-' if descending else ''
+        posts = posts.order_by(*[prefix + key for key in keys])
+        return OffsetPaginator(posts, per_page).get_page(page_number)
+    cursor_paginator = CursorPaginator(posts, per_page, keys, descending)
+    try:
+        if 'after' in request.GET:
+            return cursor_paginator.page_after(request.GET['after'])
+        if 'before' in request.GET:
+            return cursor_paginator.page_before(request.GET['before'])
+    except InvalidCursor:
+        return cursor_paginator.first_page()
+    if 'last' in request.GET:
+        return cursor_paginator.last_page()
+    return cursor_paginator.first_page()
@@ -0,0 +1,138 @@
+import json
+from http import HTTPStatus
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts import api
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='api_author')
+        cls.reader = User.objects.create_user(username='api_reader')
+        cls.group = Group.objects.create(
+            title='Группа API',
+            slug='api-group',
+            description='Описание группы API',
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост API {number}',
+                author=cls.user,
+                group=cls.group if number % 2 else None,
+            )
+            for number in range(13)
+        ]
+        cls.comment = Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий API'
+        )
+
+    def walk(self, url, client=None):
+        """id постов со всех страниц списка по ссылкам next"""
+        client = client or self.client
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            data = response.json()
+            ids.extend(post['id'] for post in data['results'])
+            url = data['next']
+        return ids
+
+    def test_posts_list_cursor_pagination(self):
+        """Список постов листается курсорами без пропусков и повторов"""
+        expected = [post.pk for post in reversed(self.posts)]
+        self.assertEqual(self.walk(reverse('posts:api_posts')), expected)
+        self.assertEqual(
+            self.walk(reverse('posts:api_posts') + '?limit=4'), expected
+        )
+        data = self.client.get(reverse('posts:api_posts')).json()
+        self.assertIsNone(data['previous'])
+        self.assertEqual(data['results'][0], {
+            'id': self.posts[-1].pk,
+            'text': 'Пост API 12',
+            'pub_date': data['results'][0]['pub_date'],
+            'author': 'api_author',
+            'group': None,
+            'image': None,
+            'comments_count': 0,
+        })
+
+    def test_posts_list_filters(self):
+        url = reverse('posts:api_posts')
+        in_group = [post.pk for post in reversed(self.posts) if post.group]
+        self.assertEqual(
+            self.walk(f'{url}?group=api-group&limit=2'), in_group
+        )
+        self.assertEqual(self.walk(f'{url}?author=api_reader'), [])
+
+    def test_invalid_cursor_is_bad_request(self):
+        response = self.client.get(reverse('posts:api_posts') + '?after=x')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_feed_requires_login(self):
+        response = self.client.get(reverse('posts:api_feed'))
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        client = Client()
+        client.force_login(self.reader)
+        self.assertEqual(self.walk(reverse('posts:api_feed'), client), [])
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(
+            self.walk(reverse('posts:api_feed'), client),
+            [post.pk for post in reversed(self.posts)],
+        )
+
+    def test_post_detail_with_comments(self):
+        response = self.client.get(
+            reverse('posts:api_post', args=(self.posts[0].pk,))
+        )
+        data = response.json()
+        self.assertEqual(data['text'], 'Пост API 0')
+        self.assertEqual(data['comments_count'], 1)
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            ['Комментарий API'],
+        )
+        response = self.client.get(reverse('posts:api_post', args=(10 ** 6,)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_groups_list(self):
+        data = self.client.get(reverse('posts:api_groups')).json()
+        self.assertEqual(data['results'], [{
+            'id': self.group.pk,
+            'title': 'Группа API',
+            'slug': 'api-group',
+            'description': 'Описание группы API',
+        }])
+
+    def test_export_streams_ndjson(self):
+        """Выгрузка идет потоком порциями по строке на объект"""
+        url = reverse('posts:api_export', args=('posts',))
+        with mock.patch.object(api, 'EXPORT_LINES_PER_WRITE', 5):
+            response = self.client.get(url)
+            chunks = list(response.streaming_content)
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        self.assertEqual(len(chunks), 3)
+        rows = [
+            json.loads(line)
+            for line in b''.join(chunks).decode().splitlines()
+        ]
+        self.assertEqual([row['id'] for row in rows],
+                         [post.pk for post in self.posts])
+        response = self.client.get(f'{url}?after_id={self.posts[10].pk}')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+
+    def test_export_unknown_kind(self):
+        response = self.client.get(
+            reverse('posts:api_export', args=('users',))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
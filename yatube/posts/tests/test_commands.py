@@ -0,0 +1,277 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from posts import search
+from posts.bulk import bulk_create_dated
+from posts.models import Comment, FeedEntry, Follow, Group, Post, User
+
+
+class BulkCreateDatedTests(TestCase):
+    def test_ids_assigned_under_write_lock(self):
+        """Даты сохраняются, а id раздаются только под блокировкой записи"""
+        author = User.objects.create_user(username='bulk_author')
+        date = datetime(2014, 1, 1, tzinfo=timezone.utc)
+        posts = [Post(id=700, text='С id', author=author, pub_date=date),
+                 Post(text='Без id', author=author, pub_date=date)]
+        with CaptureQueriesContext(connection) as queries:
+            bulk_create_dated(Post, posts, 'pub_date')
+        self.assertEqual(posts[1].pk, 701)
+        self.assertEqual(
+            set(Post.objects.values_list('pub_date', flat=True)), {date}
+        )
+        sql = [query['sql'] for query in queries.captured_queries]
+        lock = next(n for n, q in enumerate(sql) if q.endswith('WHERE 0'))
+        last_id = next(n for n, q in enumerate(sql) if 'MAX(' in q)
+        self.assertLess(lock, last_id)
+
+
+class SeedCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, **options):
+        options = {
+            'users': 20, 'groups': 3, 'posts': 60, 'comments': 80,
+            'follows': 30, 'seed': 1, 'stdout': StringIO(), **options,
+        }
+        call_command('seed_yatube', **options)
+
+    def test_seed_creates_data_and_derived_tables(self):
+        """seed_yatube создает данные и пересчитывает производные таблицы"""
+        self.seed()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 80)
+        self.assertEqual(Follow.objects.count(), 30)
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')).exists())
+        post = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        self.assertEqual(
+            post.author.stats.posts_count, post.author.posts.count()
+        )
+        follow = Follow.objects.first()
+        self.assertTrue(FeedEntry.objects.filter(
+            user_id=follow.user_id, author_id=follow.author_id
+        ).exists())
+        self.assertIn(post.pk, search.search(post.text.split()[0]))
+
+    def test_seed_keeps_dates_and_skews_authors(self):
+        """Даты публикаций разнесены по времени, авторы неравномерны"""
+        self.seed(days=30)
+        dates = list(Post.objects.values_list('pub_date', flat=True))
+        self.assertGreater((max(dates) - min(dates)).days, 1)
+        for comment in Comment.objects.select_related('post'):
+            self.assertGreaterEqual(comment.created, comment.post.pub_date)
+        counts = sorted(
+            User.objects.values_list('stats__posts_count', flat=True),
+            reverse=True,
+        )
+        self.assertGreater(counts[0], 3 * counts[len(counts) // 2])
+
+    def test_seed_refuses_existing_prefix(self):
+        self.seed(posts=0, comments=0, follows=0)
+        with self.assertRaises(CommandError):
+            self.seed(posts=0, comments=0, follows=0)
+
+
+class BenchCommandTests(TestCase):
+    def test_bench_reports_every_page(self):
+        """bench_views выдает перцентили, запросы и размер в JSON"""
+        cache.clear()
+        call_command(
+            'seed_yatube', users=10, groups=2, posts=30, comments=20,
+            follows=10, seed=2, stdout=StringIO(),
+        )
+        out = StringIO()
+        call_command(
+            'bench_views', iterations=3, warmup=0, writes=True,
+            stdout=out, stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['meta']['data']['posts'], 30)
+        results = report['results']
+        for name in ('index', 'group_list', 'profile', 'post_detail',
+                     'search', 'follow_index', 'follow_unfollow'):
+            with self.subTest(name=name):
+                self.assertIn(name, results)
+                self.assertLessEqual(
+                    results[name]['p50_ms'], results[name]['p99_ms']
+                )
+        self.assertEqual(results['index']['status'], 200)
+        self.assertGreater(results['index']['bytes'], 0)
+        self.assertEqual(results['follow_unfollow']['status'], 302)
+        self.assertGreater(results['post_detail']['queries'], 0)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = tempfile.mkdtemp()
+        cls.author = User.objects.create_user(username='known_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.source, ignore_errors=True)
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, kind, path, **options):
+        out = StringIO()
+        call_command('import_content', kind, path, stdout=out,
+                     stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_import_posts_keeps_dates_and_ids(self):
+        """Посты загружаются с исходными id и датами"""
+        path = self.write('posts.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'id': 500, 'text': 'Импортированный пост', 'author': 'new_one',
+             'group': 'imported', 'pub_date': '2015-03-01T10:00:00+00:00'},
+            {'id': 501, 'text': 'Еще пост', 'author': 'known_author',
+             'pub_date': '2016-01-01T00:00:00'},
+        ]))
+        output = self.load('posts', path, create_users=True,
+                           create_groups=True, batch_size=1)
+        self.assertIn('строк/с', output)
+        post = Post.objects.get(pk=500)
+        self.assertEqual(
+            post.pub_date, datetime(2015, 3, 1, 10, tzinfo=timezone.utc)
+        )
+        self.assertEqual(post.group.slug, 'imported')
+        self.assertEqual(post.author.username, 'new_one')
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).stats.posts_count, 1
+        )
+        self.assertEqual(search.search('импортированный'), [500])
+        self.assertGreater(
+            Post.objects.create(text='После', author=self.author).pk, 501
+        )
+
+    def test_unknown_author_skipped(self):
+        """Без --create-users посты неизвестных авторов пропускаются"""
+        path = self.write('one.jsonl', json.dumps(
+            {'text': 'Пост', 'author': 'nobody', 'group': 'no-group'}
+        ))
+        output = self.load('posts', path)
+        self.assertIn('пропущено: 1', output)
+        self.assertFalse(User.objects.filter(username='nobody').exists())
+        self.assertFalse(Post.objects.exists())
+
+    def test_import_comments_and_follows_from_csv(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        User.objects.create_user(username='reader')
+        path = self.write('comments.csv', (
+            'post,author,text,created\n'
+            f'{post.pk},reader,Первый,2020-05-05T12:00:00+00:00\n'
+            f'{post.pk},known_author,Второй,\n'
+            '999999,reader,К несуществующему,\n'
+        ))
+        self.load('comments', path)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        self.assertEqual(
+            post.comments.get(text='Первый').created,
+            datetime(2020, 5, 5, 12, tzinfo=timezone.utc),
+        )
+        path = self.write('follows.csv', 'user,author\nreader,known_author\n')
+        self.load('follows', path)
+        reader = User.objects.get(username='reader')
+        self.assertEqual(reader.stats.following_count, 1)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=reader, post=post).exists()
+        )
+
+    def test_import_copies_images(self):
+        """Картинка пережимается, как при загрузке через форму"""
+        buffer = BytesIO()
+        Image.new('RGBA', (30, 10), 'red').save(buffer, 'PNG')
+        with open(os.path.join(self.source, 'pic.png'), 'wb') as image:
+            image.write(buffer.getvalue())
+        path = self.write('images.jsonl', json.dumps(
+            {'text': 'С картинкой', 'author': 'known_author',
+             'image': 'pic.png'}
+        ))
+        self.load('posts', path, images=self.source)
+        post = Post.objects.get(text='С картинкой')
+        self.assertTrue(post.image.name.startswith('posts/pic'))
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual((post.image_width, post.image_height), (30, 10))
+        with Image.open(
+            os.path.join(TEMP_MEDIA_ROOT, post.image.name)
+        ) as saved:
+            self.assertEqual(saved.format, 'JPEG')
+
+    def test_import_rejects_paths_outside_images(self):
+        """Путь картинки не выходит из каталога --images"""
+        images = os.path.join(self.source, 'images')
+        os.makedirs(images, exist_ok=True)
+        secret = self.write('secret.txt', 'SECRET_KEY')
+        for image in ('../secret.txt', secret):
+            with self.subTest(image=image):
+                path = self.write('escape.jsonl', json.dumps(
+                    {'text': 'Чужой файл', 'author': 'known_author',
+                     'image': image}
+                ))
+                with self.assertRaises(CommandError):
+                    self.load('posts', path, images=images)
+        self.assertFalse(Post.objects.filter(text='Чужой файл').exists())
+        self.assertFalse(os.path.exists(os.path.join(TEMP_MEDIA_ROOT, 'posts',
+                                                     'secret.txt')))
+
+    def test_import_rejects_non_images(self):
+        self.write('notes.png', 'не картинка')
+        path = self.write('fake.jsonl', json.dumps(
+            {'text': 'Не картинка', 'author': 'known_author',
+             'image': 'notes.png'}
+        ))
+        with self.assertRaises(CommandError):
+            self.load('posts', path, images=self.source)
+        self.assertFalse(Post.objects.filter(text='Не картинка').exists())
+
+    def test_broken_row_is_command_error(self):
+        path = self.write('broken.jsonl', '{"text": "без автора"}')
+        with self.assertRaises(CommandError):
+            self.load('posts', path)
+
+    def test_rows_before_error_are_maintained(self):
+        """Пачки до ошибки попадают в счетчики и поиск"""
+        path = self.write('half.jsonl', '\n'.join([
+            json.dumps({'text': 'Успевший пост', 'author': 'known_author'}),
+            '{"text": "без автора"}',
+        ]))
+        with self.assertRaises(CommandError):
+            self.load('posts', path, batch_size=1)
+        post = Post.objects.get(text='Успевший пост')
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).stats.posts_count, 1
+        )
+        self.assertEqual(search.search('успевший'), [post.pk])
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import threading
+from http import HTTPStatus
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from posts import events
+from posts.models import Comment, Follow, Post
+
+from core.testing import run_on_commit
+
+User = get_user_model()
+
+
+class EventsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='events_author')
+        cls.other = User.objects.create_user(username='events_other')
+        cls.reader = User.objects.create_user(username='events_reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.last_id = events.broker.last_id
+
+    def poll(self, client=None, **params):
+        params.setdefault('last', self.last_id)
+        return (client or self.client).get(reverse('posts:events_poll'),
+                                           params)
+
+    def test_signals_publish_events(self):
+        """Новый пост и комментарий публикуют события в свои каналы"""
+        with run_on_commit():
+            post = Post.objects.create(text='Новый пост', author=self.author)
+            comment = Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'
+            )
+        found = events.broker.wait(
+            {events.index_channel(), events.post_channel(self.post.pk),
+             events.author_channel(self.author.pk)},
+            self.last_id, 0,
+        )
+        self.assertEqual(
+            [(event.channel, event.name, event.data) for event in found],
+            [
+                ('index', 'post', {'id': post.pk, 'author': self.author.pk}),
+                (f'author:{self.author.pk}', 'post',
+                 {'id': post.pk, 'author': self.author.pk}),
+                (f'post:{self.post.pk}', 'comment',
+                 {'id': comment.pk, 'post': self.post.pk}),
+            ],
+        )
+
+    def test_poll_returns_missed_events(self):
+        """Long-poll сразу отдает события после ?last="""
+        events.broker.publish('index', 'post', {'id': 1})
+        response = self.poll(feed='index')
+        data = response.json()
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(data['last'], self.last_id + 1)
+        self.assertEqual(
+            data['events'],
+            [{'id': self.last_id + 1, 'event': 'post', 'data': {'id': 1}}],
+        )
+
+    @override_settings(EVENTS_STREAMING=True, EVENTS_POLL_TIMEOUT=0)
+    def test_poll_timeout(self):
+        """Без событий long-poll возвращает пустой список и last"""
+        data = self.poll(feed='post', post=self.post.pk).json()
+        self.assertEqual(data, {'last': self.last_id, 'events': []})
+
+    @override_settings(EVENTS_STREAMING=False, EVENTS_POLL_TIMEOUT=25)
+    def test_poll_does_not_wait_without_streaming(self):
+        """Под WSGI poll не держит поток сервера в ожидании событий"""
+        with mock.patch.object(
+            events.broker, 'wait', wraps=events.broker.wait
+        ) as wait:
+            data = self.poll(feed='index').json()
+        self.assertEqual(wait.call_args[0][2], 0)
+        self.assertEqual(data, {'last': self.last_id, 'events': []})
+
+    @override_settings(EVENTS_STREAMING=False)
+    def test_stream_disabled_without_streaming(self):
+        response = self.client.get(reverse('posts:events'), {'feed': 'index'})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_unknown_feed(self):
+        """Неизвестная лента и подписки гостя - ошибка 400"""
+        for params in ({'feed': 'all'}, {'feed': 'follow'},
+                       {'feed': 'post', 'post': 'abc'}):
+            with self.subTest(params=params):
+                response = self.poll(**params)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+
+    @override_settings(EVENTS_POLL_TIMEOUT=0)
+    def test_follow_feed_listens_to_followed_authors(self):
+        """Лента подписок получает посты только своих авторов"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        events.broker.publish(
+            events.author_channel(self.other.pk), 'post', {'id': 1}
+        )
+        events.broker.publish(
+            events.author_channel(self.author.pk), 'post', {'id': 2}
+        )
+        data = self.poll(self.reader_client, feed='follow').json()
+        self.assertEqual(
+            [event['data'] for event in data['events']], [{'id': 2}]
+        )
+
+    @override_settings(EVENTS_STREAMING=True, EVENTS_STREAM_SECONDS=0.2,
+                       EVENTS_HEARTBEAT=0.1)
+    def test_stream(self):
+        """Поток отдает пропущенные события и не сжимается"""
+        events.broker.publish('index', 'post', {'id': 3})
+        response = self.client.get(
+            reverse('posts:events'), {'feed': 'index'},
+            HTTP_LAST_EVENT_ID=str(self.last_id),
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+        self.assertTrue(response['Content-Type'].startswith(
+            'text/event-stream'
+        ))
+        self.assertNotIn('Content-Encoding', response)
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn(
+            f'id: {self.last_id + 1}\nevent: post\ndata: {{"id": 3}}\n\n',
+            body,
+        )
+        self.assertIn(': ping\n\n', body)
+
+    def test_pages_subscribe_to_events(self):
+        """Страницы лент и поста подключают поток, а без него - опрос"""
+        pages = (
+            (reverse('posts:index'), 'feed=index'),
+            (reverse('posts:post_detail', args=(self.post.pk,)),
+             f'feed=post&amp;post={self.post.pk}'),
+            (reverse('posts:follow_index'), 'feed=follow'),
+        )
+        stream = f'data-events="{reverse("posts:events")}?'
+        for streaming in (True, False):
+            for url, query in pages:
+                with self.subTest(url=url, streaming=streaming), \
+                        override_settings(EVENTS_STREAMING=streaming,
+                                          EVENTS_POLL_INTERVAL=45):
+                    cache.clear()
+                    response = self.reader_client.get(url)
+                    self.assertContains(
+                        response,
+                        f'data-events-poll="{reverse("posts:events_poll")}?'
+                        f'{query}"'
+                    )
+                    if streaming:
+                        self.assertContains(response, f'{stream}{query}"')
+                        self.assertNotContains(
+                            response, 'data-events-interval'
+                        )
+                    else:
+                        self.assertNotContains(response, stream)
+                        self.assertContains(
+                            response, 'data-events-interval="45"'
+                        )
+
+
+class AsgiEventsTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from yatube.asgi import application
+        cls.application = application
+
+    def request(self, path, query='', headers=(), duration=None):
+        """Ответ ASGI-приложения; duration - когда клиент отключится"""
+        messages = []
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'root_path': '',
+            'query_string': query.encode(),
+            'headers': [(name.encode(), value.encode())
+                        for name, value in headers],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 1234),
+        }
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': b''}
+            if duration is not None:
+                await asyncio.sleep(duration)
+            else:
+                await asyncio.Event().wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        status = messages[0]['status']
+        headers = dict(messages[0]['headers'])
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return status, headers, body
+
+    def publish_later(self, *args):
+        timer = threading.Timer(0.05, events.broker.publish, args)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    @override_settings(EVENTS_POLL_TIMEOUT=5)
+    def test_poll_wakes_up_on_publish(self):
+        """Long-poll без потока просыпается от события из другого потока"""
+        self.publish_later('index', 'post', {'id': 4})
+        status, headers, body = self.request(
+            reverse('posts:events_poll'), 'feed=index'
+        )
+        self.assertEqual(status, 200)
+        data = json.loads(body)
+        self.assertEqual(data['events'][0]['data'], {'id': 4})
+        self.assertEqual(data['last'], data['events'][0]['id'])
+
+    @override_settings(EVENTS_HEARTBEAT=5)
+    def test_stream_until_disconnect(self):
+        """Поток отдает события и завершается при отключении клиента"""
+        self.publish_later('post:5', 'comment', {'id': 6, 'post': 5})
+        status, headers, body = self.request(
+            reverse('posts:events'), 'feed=post&post=5', duration=0.3
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'cache-control'], b'no-cache, no-transform')
+        self.assertIn(
+            b'event: comment\ndata: {"id": 6, "post": 5}\n\n', body
+        )
+
+    def test_unknown_feed(self):
+        status, headers, body = self.request(
+            reverse('posts:events'), 'feed=follow'
+        )
+        self.assertEqual(status, 400)
+
+    def test_other_requests_go_to_django(self):
+        """Остальные адреса обслуживает WSGI-приложение Django"""
+        status, headers, body = self.request(reverse('about:author'))
+        self.assertEqual(status, 200)
+        self.assertIn('Об авторе'.encode(), body)
@@ -1,16 +1,34 @@
+import os
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError
+from django.db.models.signals import post_save
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+
+from core import sqlite
+from posts import thumbnails
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 User = get_user_model()
 
@@ -161,6 +179,129 @@ class PostFormTest(TestCase):
             response_get, '/auth/login/?next=%2Fposts%2F1%2Fedit%2F'
         )
 
+    def test_edit_post_image_generates_thumbnails(self):
+        """Новая картинка при редактировании отправляется на генерацию
+        миниатюр, а сама генерация создает файлы миниатюр"""
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=SMALL_GIF,
+            content_type='image/gif',
+        )
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+                data={'text': self.post.text, 'image': uploaded},
+            )
+        post = Post.objects.get(pk=self.post.id)
+        schedule.assert_called_once_with(post)
+        self.assertTrue(thumbnails.generate(post.image.name))
+        call_command('warm_thumbnails', stdout=StringIO())
+        cache_dir = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+        self.assertTrue(any(files for _, _, files in os.walk(cache_dir)))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='photographer')
+        cls.client_author = Client()
+        cls.client_author.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def camera_jpeg(self):
+        """Снимок 40x20, который EXIF велит повернуть на 90 градусов"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes()
+        )
+        return SimpleUploadedFile(
+            name='camera.JPG',
+            content=buffer.getvalue(),
+            content_type='image/jpeg',
+        )
+
+    def test_create_normalizes_image(self):
+        """Картинка при создании поста поворачивается и пережимается"""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client_author.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост со снимком', 'image': self.camera_jpeg()},
+            )
+        post = Post.objects.get(text='Пост со снимком')
+        schedule.assert_called_once_with(post)
+        self.assertTrue(post.image.name.endswith('camera.jpg'))
+        self.assertEqual((post.image_width, post.image_height), (20, 40))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertTrue(image.info.get('progressive'))
+            self.assertEqual(image.size, (20, 40))
+            self.assertFalse(image.getexif())
+
+    def test_locked_retry_writes_image_once(self):
+        """При занятой базе повторяется запись строки, а не файла"""
+        attempts = []
+
+        def locked_once(sender, instance, created, **kwargs):
+            attempts.append(created)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+
+        upload = self.camera_jpeg()
+        upload.name = 'retried.jpg'
+        post_save.connect(locked_once, sender=Post)
+        try:
+            # TestCase держит внешнюю транзакцию, в ней повтор отключен
+            with mock.patch.object(sqlite, 'connection') as outer, \
+                    mock.patch.object(sqlite.time, 'sleep'), \
+                    self.assertLogs('core.sqlite', 'WARNING'):
+                outer.in_atomic_block = False
+                self.client_author.post(
+                    reverse('posts:post_create'),
+                    data={'text': 'Пост с повтором', 'image': upload},
+                )
+        finally:
+            post_save.disconnect(locked_once, sender=Post)
+        self.assertEqual(attempts, [True, True])
+        post = Post.objects.get(text='Пост с повтором')
+        self.assertTrue(os.path.exists(post.image.path))
+        saved = [
+            name for name in os.listdir(os.path.dirname(post.image.path))
+            if name.startswith('retried')
+        ]
+        self.assertEqual(saved, [os.path.basename(post.image.name)])
+
+    @override_settings(POST_IMAGE_MAX_SIZE=10)
+    def test_image_is_downscaled(self):
+        self.client_author.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большой снимок', 'image': self.camera_jpeg()},
+        )
+        post = Post.objects.get(text='Большой снимок')
+        self.assertEqual((post.image_width, post.image_height), (5, 10))
+
+    @override_settings(UPLOAD_MAX_SIZE=100)
+    def test_oversized_upload_is_rejected(self):
+        """Слишком большой файл не пропадает молча, а дает ошибку формы"""
+        response = self.client_author.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с огромной картинкой',
+                  'image': self.camera_jpeg()},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertFalse(
+            Post.objects.filter(text='Пост с огромной картинкой').exists()
+        )
+
 
 class CommentFormTest(TestCase):
     @classmethod
@@ -1,7 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Comment, Follow, Group, Post
+from ..models import Comment, Follow, Group, GroupStats, Post, UserStats
 
 User = get_user_model()
 
@@ -131,3 +136,115 @@ class ModelTests(TestCase):
                     expected,
                     'Ошибка в verbose_name'
                 )
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='counter_author')
+        cls.reader = User.objects.create_user(username='counter_reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются вместе с постами, комментариями и подписками"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ком')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_post_delete_cost_independent_of_comments(self):
+        """Каскадное удаление комментариев не пересчитывает сам пост"""
+        queries = []
+        for comments in (1, 5):
+            post = Post.objects.create(author=self.author, text='Пост')
+            for number in range(comments):
+                Comment.objects.create(post=post, author=self.reader,
+                                       text=f'Ком {number}')
+            post = Post.objects.get(pk=post.pk)
+            with CaptureQueriesContext(connection) as captured:
+                post.delete()
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+        comment = Comment.objects.create(
+            post=Post.objects.create(author=self.author, text='Пост'),
+            author=self.reader, text='Ком',
+        )
+        comment.delete()
+        comment.post.refresh_from_db()
+        self.assertEqual(comment.post.comments_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет рассинхронизированные счетчики"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ком')
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        Post.objects.filter(pk=post.pk).update(comments_count=7)
+        call_command('recount', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+
+
+class GroupStatsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='stats_author')
+        cls.group = Group.objects.create(title='Первая', slug='first')
+        cls.other = Group.objects.create(title='Вторая', slug='second')
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_rollup_follows_posts(self):
+        """Сводка групп меняется при создании, переносе и удалении поста"""
+        old = Post.objects.create(
+            author=self.author, text='Старый пост', group=self.group
+        )
+        new = Post.objects.create(
+            author=self.author, text='Новый пост', group=self.group
+        )
+        stats = self.stats(self.group)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.last_post_id, new.pk)
+        self.assertEqual(stats.last_post_text, 'Новый пост')
+        new.text = 'Новый текст'
+        new.save()
+        self.assertEqual(self.stats(self.group).last_post_text, 'Новый текст')
+        # Перенос в другую группу, как в post_edit или list_editable
+        new = Post.objects.get(pk=new.pk)
+        new.group = self.other
+        new.save()
+        stats = self.stats(self.group)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.last_post_id, old.pk)
+        self.assertEqual(self.stats(self.other).posts_count, 1)
+        self.assertEqual(self.stats(self.other).last_post_id, new.pk)
+        old.delete()
+        stats = self.stats(self.group)
+        self.assertEqual(stats.posts_count, 0)
+        self.assertIsNone(stats.last_post_id)
+        self.assertEqual(stats.last_post_text, '')
+
+    def test_recount_groups(self):
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        GroupStats.objects.all().delete()
+        call_command('recount', stdout=StringIO())
+        stats = self.stats(self.group)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.last_post_id, post.pk)
+        self.assertEqual(self.stats(self.other).posts_count, 0)
@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+
+from .. import urls
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Создаем автора, читателя, группу и ленту подписок"""
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='budget_author')
+        cls.reader = User.objects.create_user(username='budget_reader')
+        cls.group = Group.objects.create(
+            title='Группа для бюджета',
+            slug='budget-group',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.author_client = Client()
+        cls.author_client.force_login(cls.author)
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+
+    def create_posts(self, amount):
+        for number in range(amount):
+            post = Post.objects.create(text=f'Пост {number}',
+                                       author=self.author,
+                                       group=self.group,
+                                       )
+            for comment_number in range(3):
+                Comment.objects.create(post=post,
+                                       author=self.reader,
+                                       text=f'Комментарий {comment_number}',
+                                       )
+        return post
+
+    def urls(self, post):
+        return {
+            reverse('posts:index'): self.reader_client,
+            reverse('posts:groups'): self.reader_client,
+            reverse('posts:group_list',
+                    kwargs={'slug': self.group.slug}): self.reader_client,
+            reverse('posts:profile',
+                    kwargs={'username': self.author}): self.reader_client,
+            reverse('posts:post_detail',
+                    kwargs={'post_id': post.id}): self.reader_client,
+            reverse('posts:post_create'): self.author_client,
+            reverse('posts:post_edit',
+                    kwargs={'post_id': post.id}): self.author_client,
+            reverse('posts:add_comment',
+                    kwargs={'post_id': post.id}): self.reader_client,
+            reverse('posts:follow_index'): self.reader_client,
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.author}): self.reader_client,
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.author}): self.reader_client,
+        }
+
+    def test_views_within_budget_for_any_page_size(self):
+        """Число запросов не зависит от количества постов на странице"""
+        for amount in (1, 15):
+            post = self.create_posts(amount)
+            for url, client in self.urls(post).items():
+                with self.subTest(amount=amount, url=url):
+                    cache.clear()
+                    self.assertWithinQueryBudget(client, url)
+
+    def test_every_view_declares_budget(self):
+        """У каждой вьюхи posts объявлен бюджет запросов"""
+        for pattern in urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertTrue(
+                    hasattr(pattern.callback, 'query_budget'),
+                    f'Для posts:{pattern.name} не объявлен бюджет запросов'
+                )
@@ -0,0 +1,99 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Полный проход по таблице без индекса
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?posts_\w+$')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR .*ORDER BY')
+
+
+class QueryPlanTests(TestCase):
+    """Каждый запрос ленты должен идти по индексу и без сортировки"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = [
+            User.objects.create_user(username=f'plan_author_{number}')
+            for number in range(3)
+        ]
+        cls.reader = User.objects.create_user(username='plan_reader')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {number}',
+                                 slug=f'plan-group-{number}')
+            for number in range(2)
+        ]
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+        for number in range(36):
+            post = Post.objects.create(
+                text=f'Пост {number}',
+                author=cls.authors[number % 3],
+                group=cls.groups[number % 2] if number % 5 else None,
+            )
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text='Комментарий')
+        cls.post = post
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def feed_urls(self):
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list',
+                    kwargs={'slug': self.groups[0].slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.authors[0].username}),
+            reverse('posts:follow_index'),
+        ]
+
+    def capture(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(url)
+        return response, [query['sql'] for query in queries]
+
+    def plans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlans(self, url, queries):
+        for sql in queries:
+            if not sql.startswith('SELECT') or 'posts_' not in sql:
+                continue
+            for detail in self.plans(sql):
+                with self.subTest(url=url, detail=detail, sql=sql):
+                    self.assertIsNone(FULL_SCAN.match(detail))
+                    self.assertIsNone(TEMP_SORT.search(detail))
+
+    def test_feed_queries_use_indexes(self):
+        """Все страницы лент, включая курсорные, читаются по индексам"""
+        for url in self.feed_urls():
+            response, queries = self.capture(url)
+            self.assertIndexedPlans(url, queries)
+            page_obj = response.context['page_obj']
+            for query in (page_obj.last_query, 'page=2',
+                          page_obj.next_query):
+                response, queries = self.capture(f'{url}?{query}')
+                self.assertIndexedPlans(f'{url}?{query}', queries)
+            # Курсор назад берем со страницы, открытой по ?after=
+            page_obj = response.context['page_obj']
+            cursor_url = f'{url}?{page_obj.previous_query}'
+            self.assertIndexedPlans(cursor_url, self.capture(cursor_url)[1])
+
+    def test_post_detail_queries_use_indexes(self):
+        """Страница поста и комментарии читаются по индексам"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.assertIndexedPlans(url, self.capture(url)[1])
@@ -33,6 +33,7 @@ class PostsURLTests(TestCase):
         cls.url = {
             'guest_client': {
                 '/': 'posts/index.html',
+                '/group/': 'posts/groups.html',
                 '/group/test-group-slug/': 'posts/group_list.html',
                 '/profile/authorized_user/': 'posts/profile.html',
                 f'/posts/{cls.post.id}/': 'posts/post_detail.html',
@@ -1,15 +1,26 @@
+import base64
 import shutil
 import tempfile
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
 from django import forms as django_forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.images import ImageFile
 
-from ..models import Comment, Follow, Group, Post
+from core.testing import run_on_commit
+
+from .. import cards, feed, follow_graph, search, thumbnails
+from ..models import Comment, FeedEntry, Follow, Group, Post
+from ..support_def import AMT_COMMENTS
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -166,6 +177,18 @@ class PostsPagesTests(TestCase):
         self.assertEqual(post_author_0, self.post[0].author)
         self.assertEqual(post_image_0, self.post[0].image)
 
+    def test_groups_page_show_correct_context(self):
+        """Каталог групп берет число постов и последний пост из сводки"""
+        response = self.guest_client.get(reverse('posts:groups'))
+        stats = list(response.context['stats'])
+        self.assertEqual(
+            [item.group for item in stats], [self.group, self.group_2]
+        )
+        self.assertEqual(stats[0].posts_count, 15)
+        self.assertEqual(stats[0].last_post_id, self.post[0].id)
+        self.assertEqual(stats[1].posts_count, 0)
+        self.assertContains(response, self.post[0].text)
+
     def test_post_detail_page_show_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом."""
         response = self.authorized_client.get(
@@ -192,14 +215,19 @@ class PostsPagesTests(TestCase):
                 self.assertIsInstance(form_field, expected)
 
     def test_cache_index_page(self):
-        """После удаления поста он остается до очистки кеша"""
+        """Лента главной берется из кеша до изменения постов"""
+        cache.clear()
         response1 = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.create(text='qwerty', author=self.user)
-        response2 = self.authorized_client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as queries:
+            response2 = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response1.content, response2.content)
-        cache.clear()
+        self.assertFalse([q for q in queries if 'posts_post' in q['sql']])
+        post = Post.objects.create(text='qwerty', author=self.user)
         response3 = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(response3.content, response2.content)
+        self.assertContains(response3, 'qwerty')
+        post.delete()
+        response4 = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response4, 'qwerty')
 
 
 class PaginatorViewsTest(TestCase):
@@ -251,6 +279,56 @@ class PaginatorViewsTest(TestCase):
                 5,
             )
 
+    def test_cursor_pages(self):
+        """Курсоры ?after= и ?before= листают ленту без пропусков"""
+        cache.clear()
+        for page_name in self.templates_page_names:
+            with self.subTest(page_name=page_name):
+                first = self.client.get(page_name).context['page_obj']
+                self.assertFalse(first.has_previous())
+                self.assertTrue(first.has_next())
+                second = self.client.get(
+                    f'{page_name}?{first.next_query}'
+                ).context['page_obj']
+                self.assertEqual(list(second), self.post[10:])
+                self.assertFalse(second.has_next())
+                back = self.client.get(
+                    f'{page_name}?{second.previous_query}'
+                ).context['page_obj']
+                self.assertEqual(list(back), self.post[:10])
+                last = self.client.get(
+                    f'{page_name}?{first.last_query}'
+                ).context['page_obj']
+                self.assertEqual(list(last), self.post[5:])
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Испорченный курсор ведет на первую страницу"""
+        response = self.client.get(
+            reverse('posts:index') + '?after=not-a-cursor'
+        )
+        self.assertEqual(list(response.context['page_obj']), self.post[:10])
+
+    def test_cursor_with_empty_values_shows_first_page(self):
+        """Курсор с null вместо значений ключа ведет на первую страницу"""
+        token = base64.urlsafe_b64encode(b'[null,null]').decode()
+        for param in ('after', 'before'):
+            with self.subTest(param=param):
+                response = self.client.get(
+                    reverse('posts:index'), {param: token}
+                )
+                self.assertEqual(
+                    list(response.context['page_obj']), self.post[:10]
+                )
+
+    def test_cursor_page_without_count(self):
+        """Курсорная страница не выполняет COUNT(*)"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'))
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()]
+        )
+
 
 class FollowTests(TestCase):
     @classmethod
@@ -345,6 +423,120 @@ class FollowTests(TestCase):
             post_count_user_1_before,
             'Посты не должны добавляться если не подписан на автора')
 
+    def test_follow_backfills_and_unfollow_prunes_feed(self):
+        """Подписка добавляет посты автора в ленту, отписка убирает"""
+        self.user_2_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.user_1})
+        )
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=self.user_2).values_list('post_id', flat=True)),
+            {post.id for post in self.post},
+        )
+        response = self.user_2_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), self.post)
+        self.user_2_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user_1})
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.user_2,
+                                     author=self.user_1).exists()
+        )
+
+    def test_follow_graph_write_through(self):
+        """Подписка и отписка сразу меняют граф в кеше"""
+        self.assertEqual(
+            list(follow_graph.following_ids(self.user_2.pk)), [self.user_3.pk]
+        )
+        with run_on_commit():
+            self.user_2_client.get(reverse(
+                'posts:profile_follow', kwargs={'username': self.user_1}
+            ))
+            self.user_2_client.get(reverse(
+                'posts:profile_unfollow', kwargs={'username': self.user_3}
+            ))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                list(follow_graph.following_ids(self.user_2.pk)),
+                [self.user_1.pk],
+            )
+            self.assertTrue(
+                follow_graph.is_following(self.user_2.pk, self.user_1.pk)
+            )
+        Follow.objects.filter(user=self.user_2).delete()
+        Follow.objects.bulk_create(
+            [Follow(user=self.user_2, author=self.user_3)]
+        )
+        follow_graph.reset_all()
+        self.assertEqual(
+            list(follow_graph.following_ids(self.user_2.pk)), [self.user_3.pk]
+        )
+
+    def test_rolled_back_follow_not_in_graph(self):
+        """Откаченная подписка не попадает в граф и не мешает подписаться"""
+        follow_graph.following_ids(self.user_2.pk)
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                Follow.objects.create(user=self.user_2, author=self.user_1)
+                raise DatabaseError
+        self.assertFalse(
+            follow_graph.is_following(self.user_2.pk, self.user_1.pk)
+        )
+        self.user_2_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.user_1})
+        )
+        self.assertTrue(Follow.objects.filter(
+            user=self.user_2, author=self.user_1).exists())
+
+    def test_profile_reads_follow_graph(self):
+        """Кнопка подписки на профиле не обращается к таблице Follow"""
+        url = reverse('posts:profile', kwargs={'username': self.user_3})
+        self.user_2_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.user_2_client.get(url)
+        self.assertTrue(response.context['following'])
+        self.assertFalse(
+            [q for q in queries if 'posts_follow' in q['sql']]
+        )
+
+    def test_feed_is_trimmed_to_limit(self):
+        """Входящая лента не растет больше FEED_LIMIT записей"""
+        with mock.patch.object(feed, 'FEED_LIMIT', 2):
+            Follow.objects.create(user=self.user_3, author=self.user_1)
+            self.assertEqual(
+                list(FeedEntry.objects.filter(user=self.user_3)
+                     .order_by('-pub_date', '-post_id')
+                     .values_list('post_id', flat=True)),
+                [post.id for post in self.post[:2]],
+            )
+            new_post = Post.objects.create(text='Новый', author=self.user_1)
+            self.assertEqual(
+                FeedEntry.objects.filter(user=self.user_3).count(), 2
+            )
+            self.assertTrue(FeedEntry.objects.filter(
+                user=self.user_3, post=new_post).exists())
+
+    def test_fan_out_trims_in_one_statement(self):
+        """Новый пост обрезает ленты всех подписчиков одним DELETE"""
+        Follow.objects.create(user=self.user_1, author=self.user_3)
+        with mock.patch.object(feed, 'FEED_LIMIT', 1):
+            with CaptureQueriesContext(connection) as queries:
+                new_post = Post.objects.create(text='Новый',
+                                               author=self.user_3)
+            deletes = [
+                q for q in queries
+                if q['sql'].startswith('DELETE')
+                and 'posts_feedentry' in q['sql']
+            ]
+            self.assertEqual(len(deletes), 1)
+            for user in (self.user_1, self.user_2):
+                self.assertEqual(
+                    list(FeedEntry.objects.filter(user=user)
+                         .values_list('post_id', flat=True)),
+                    [new_post.pk],
+                )
+
 
 class CommentTest(TestCase):
     @classmethod
@@ -379,3 +571,513 @@ class CommentTest(TestCase):
         for value, expected in comments.items():
             self.assertEqual(value, expected)
         self.assertTrue(response.context['form'], 'форма не отображается')
+
+    def test_comments_paginated_with_fragment(self):
+        """На странице поста первая страница комментариев, дальше фрагмент"""
+        post = Post.objects.create(text='Обсуждаемый', author=self.creator)
+        comments = [
+            Comment.objects.create(post=post, author=self.commentator,
+                                   text=f'Коммент {number}')
+            for number in range(AMT_COMMENTS + 5)
+        ]
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        page = response.context['comments']
+        self.assertEqual(list(page), comments[:AMT_COMMENTS])
+        self.assertContains(response, 'data-more-comments')
+        more_url = f'{reverse("posts:comments", args=(post.id,))}?' + (
+            page.next_query
+        )
+        self.assertContains(response, more_url)
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(more_url)
+        self.assertEqual(
+            list(response.context['comments']), comments[AMT_COMMENTS:]
+        )
+        self.assertContains(response, 'Коммент 24')
+        self.assertNotContains(response, 'Коммент 19')
+        self.assertNotContains(response, 'data-more-comments')
+        self.assertNotContains(response, '<html')
+
+    def test_comments_fragment_ignores_page_number(self):
+        """?page= у фрагмента не добавляет COUNT(*) и не ломает бюджет"""
+        post = Post.objects.create(text='Со старой ссылкой',
+                                   author=self.creator)
+        comment = Comment.objects.create(post=post, author=self.commentator,
+                                         text='Единственный')
+        url = reverse('posts:comments', args=(post.id,))
+        for client in (self.guest_client, self.commentator_client):
+            with self.subTest(client=client), self.assertNumQueries(1):
+                response = client.get(url, {'page': 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['comments']), [comment])
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='card_author')
+        cls.group = Group.objects.create(
+            title='Группа карточек',
+            slug='card-group',
+        )
+        cls.post = Post.objects.create(text='Текст карточки',
+                                       author=cls.user,
+                                       group=cls.group,
+                                       )
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        return cards.render_cards(
+            Post.objects.select_related('author', 'group'),
+            'posts/includes/post_item.html',
+        )[0]
+
+    def test_warm_cards_are_not_rendered(self):
+        """Прогретая карточка берется из кеша без рендера шаблона"""
+        first = self.render()
+        with mock.patch.object(cards, 'get_template') as get_template:
+            self.assertEqual(self.render(), first)
+        get_template.assert_not_called()
+
+    def test_card_invalidated_by_related_objects(self):
+        """Изменение поста, автора или группы сбрасывает карточку"""
+        self.render()
+        self.post.text = 'Новый текст карточки'
+        self.post.save()
+        self.assertIn('Новый текст карточки', self.render())
+        self.user.first_name = 'Олег'
+        self.user.save()
+        self.assertIn('Олег', self.render())
+        self.group.slug = 'new-card-group'
+        self.group.save()
+        self.assertIn('new-card-group', self.render())
+
+    def test_login_does_not_invalidate_card(self):
+        """Обновление last_login при входе не сбрасывает карточку"""
+        first = self.render()
+        Client().force_login(self.user)
+        with mock.patch.object(cards, 'get_template') as get_template:
+            self.assertEqual(self.render(), first)
+        get_template.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CardThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='thumb_author')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        for number in range(3):
+            Post.objects.create(
+                text=f'Пост с картинкой {number}',
+                author=cls.user,
+                image=SimpleUploadedFile(
+                    name=f'thumb_{number}.gif',
+                    content=small_gif,
+                    content_type='image/gif',
+                ),
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        return cards.render_cards(
+            Post.objects.select_related('author', 'group'),
+            'posts/includes/post_item.html',
+        )
+
+    def test_thumbnails_resolved_in_one_query(self):
+        """Миниатюры всех карточек читаются из хранилища одним запросом"""
+        for post in Post.objects.all():
+            thumbnails.generate(post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            html = self.render()
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        for card in html:
+            self.assertIn('<img class="card-img my-2"', card)
+            self.assertIn('width="960" height="339"', card)
+
+    def test_thumbnail_name_matches_sorl(self):
+        """Имя миниатюры совпадает с тем, что создает get_thumbnail"""
+        post = Post.objects.first()
+        for preserve_format in (False, True):
+            with override_settings(
+                THUMBNAIL_PRESERVE_FORMAT=preserve_format
+            ):
+                for geometry, options in thumbnails.RENDITIONS:
+                    with self.subTest(geometry=geometry,
+                                      preserve_format=preserve_format):
+                        self.assertEqual(
+                            thumbnails.thumbnail_name(
+                                ImageFile(post.image), geometry, options
+                            ),
+                            get_thumbnail(post.image, geometry,
+                                          **options).name,
+                        )
+
+    def test_missing_thumbnails_queued(self):
+        """Несозданные миниатюры запрос не создает, а ставит в очередь.
+
+        До их появления карточка показывает оригинал картинки, после
+        генерации карточка сбрасывается и показывает миниатюру.
+        """
+        post = Post.objects.select_related('author', 'group').first()
+        with mock.patch.object(thumbnails, 'get_thumbnail') as get_thumbnail:
+            with mock.patch.object(thumbnails, 'schedule') as schedule:
+                card = self.render()[0]
+        get_thumbnail.assert_not_called()
+        self.assertEqual(schedule.call_count, 3)
+        self.assertIn(f'src="{post.image.url}"', card)
+        thumbnails.generate(post.image.name)
+        thumbnails.refresh(post)
+        self.assertIn('width="960" height="339"', self.render()[0])
+
+    def test_missing_image_file_does_not_break_pages(self):
+        """Старый пост без размеров и без файла картинки не дает 500"""
+        post = Post.objects.create(
+            text='Картинка потерялась', author=self.user,
+            image='posts/lost.jpg',
+        )
+        self.assertIsNone(Post.objects.get(pk=post.pk).image_width)
+        with mock.patch.object(thumbnails, 'schedule'):
+            for url in (reverse('posts:index'),
+                        reverse('posts:post_detail', args=(post.pk,))):
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+
+class FeedPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='feed_author')
+        cls.reader = User.objects.create_user(username='feed_reader')
+        cls.group = Group.objects.create(title='Первая', slug='feed-first')
+        cls.other_group = Group.objects.create(
+            title='Вторая', slug='feed-second'
+        )
+        cls.post = Post.objects.create(text='Пост первой группы',
+                                       author=cls.user,
+                                       group=cls.group,
+                                       )
+
+    def setUp(self):
+        cache.clear()
+        self.post.refresh_from_db()
+
+    def urls(self):
+        return {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', args=(self.group.slug,)),
+            'other_group': reverse(
+                'posts:group_list', args=(self.other_group.slug,)
+            ),
+            'profile': reverse('posts:profile', args=(self.user.username,)),
+        }
+
+    def cached_pages(self):
+        """Страницы, лента которых отдается без запроса к постам"""
+        cached = set()
+        for name, url in self.urls().items():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            if not [q for q in queries if 'FROM "posts_post"' in q['sql']]:
+                cached.add(name)
+        return cached
+
+    def warm(self):
+        for url in self.urls().values():
+            self.client.get(url)
+
+    def test_post_change_invalidates_only_affected_pages(self):
+        """Перенос поста сбрасывает главную, профиль и обе группы"""
+        self.warm()
+        self.assertEqual(self.cached_pages(), set(self.urls()))
+        Post.objects.create(text='Пост без группы', author=self.reader)
+        self.assertEqual(
+            self.cached_pages(), {'group', 'other_group', 'profile'}
+        )
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertEqual(self.cached_pages(), set())
+        response = self.client.get(self.urls()['other_group'])
+        self.assertContains(response, 'Пост первой группы')
+
+    def test_comment_invalidates_post_pages(self):
+        """Комментарий сбрасывает страницы, где показан его пост"""
+        self.warm()
+        Comment.objects.create(post=self.post, author=self.reader, text='!')
+        self.assertEqual(self.cached_pages(), {'other_group'})
+        response = self.client.get(self.urls()['profile'])
+        self.assertContains(response, 'Комментариев: 1')
+
+    def test_group_rename_invalidates_pages_with_its_posts(self):
+        self.warm()
+        self.group.title = 'Переименованная'
+        self.group.save()
+        self.assertEqual(self.cached_pages(), {'other_group'})
+
+    def test_header_rendered_outside_cache(self):
+        """Шапка с именем пользователя не попадает в кеш ленты"""
+        client = Client()
+        client.force_login(self.user)
+        client.get(reverse('posts:index'))
+        client.force_login(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('posts:index'))
+        self.assertFalse(
+            [q for q in queries if 'FROM "posts_post"' in q['sql']]
+        )
+        self.assertContains(response, 'Пользователь: feed_reader')
+        self.assertContains(response, 'Пост первой группы')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='etag_author')
+        cls.reader = User.objects.create_user(username='etag_reader')
+        cls.post = Post.objects.create(text='Пост с валидатором',
+                                       author=cls.author,
+                                       )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_unchanged_page_not_modified(self):
+        """Повторный запрос без изменений получает 304 без рендера"""
+        for url in (reverse('posts:index'),
+                    reverse('posts:profile', args=(self.author.username,)),
+                    reverse('posts:post_detail', args=(self.post.pk,))):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(
+                    [q for q in queries if 'posts_comment' in q['sql']
+                     or 'LIMIT 11' in q['sql']]
+                )
+
+    def test_changes_make_page_modified(self):
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(post=self.post, author=self.reader, text='!')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_button_changes_etag(self):
+        """Подписка меняет ETag профиля, ETag зависит от пользователя"""
+        url = reverse('posts:profile', args=(self.author.username,))
+        etag = self.client.get(url)['ETag']
+        with run_on_commit():
+            Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отписаться')
+        other = Client()
+        other.force_login(self.author)
+        response = other.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_csrf_secret_makes_page_modified(self):
+        """После нового входа форма не берется из кеша со старым токеном"""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.reader)
+        etag = client.get(url)['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        client.logout()
+        client.force_login(self.reader)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'После нового входа',
+             'csrfmiddlewaretoken': response.context['csrf_token']},
+        )
+        self.assertTrue(
+            Comment.objects.filter(text='После нового входа').exists()
+        )
+
+    def test_last_modified_only_for_anonymous(self):
+        url = reverse('posts:index')
+        self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+        guest = Client()
+        last_modified = guest.get(url)['Last-Modified']
+        response = guest.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_objects_still_404(self):
+        for url in (reverse('posts:profile', args=('nobody',)),
+                    reverse('posts:group_list', args=('no-group',)),
+                    reverse('posts:post_detail', args=(10 ** 6,))):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher',
+                                            first_name='Василий')
+        cls.group = Group.objects.create(title='Кулинария', slug='cooking')
+        cls.post_text = Post.objects.create(
+            text='Рецепт борща со сметаной', author=cls.user
+        )
+        cls.post_group = Post.objects.create(
+            text='Сегодня пеку пироги', author=cls.user, group=cls.group
+        )
+
+    def ids(self, query, index=None):
+        index = index or search.get_index()
+        return index.search(query)
+
+    def test_search_by_text_group_and_author(self):
+        """Поиск находит посты по тексту, группе и имени автора"""
+        self.assertEqual(self.ids('борщ'), [self.post_text.id])
+        self.assertEqual(self.ids('кулинария'), [self.post_group.id])
+        self.assertEqual(
+            set(self.ids('василий')),
+            {self.post_text.id, self.post_group.id},
+        )
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении постов и групп"""
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Выпечка'
+        group.save()
+        self.assertEqual(self.ids('выпечка'), [self.post_group.id])
+        post = Post.objects.get(pk=self.post_text.pk)
+        post.text = 'Рецепт окрошки'
+        post.save()
+        self.assertEqual(self.ids('борщ'), [])
+        post.delete()
+        self.assertEqual(self.ids('окрошки'), [])
+
+    def test_python_index(self):
+        """Запасной индекс на Python ищет и ранжирует так же"""
+        index = search.PythonIndex('default')
+        index.update(Post.objects.select_related('author', 'group'))
+        self.assertEqual(self.ids('борща', index), [self.post_text.id])
+        self.assertEqual(self.ids('пироги кулинария', index),
+                         [self.post_group.id])
+        self.assertEqual(self.ids('пироги борща', index), [])
+
+    def test_backends_match_prefixes(self):
+        """Оба индекса ищут слова запроса по началу слова"""
+        python_index = search.PythonIndex('default')
+        python_index.update(Post.objects.select_related('author', 'group'))
+        for index in (search.get_index(), python_index):
+            with self.subTest(index=type(index).__name__):
+                self.assertEqual(self.ids('бор', index), [self.post_text.id])
+                self.assertEqual(self.ids('пек кулин', index),
+                                 [self.post_group.id])
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные посты"""
+        response = self.client.get(reverse('posts:search'), {'q': 'пироги'})
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.post_group])
+        self.assertTemplateUsed(response, 'posts/search.html')
+
+
+# Движок Jinja2 первым: страницы posts рендерятся шаблонами из posts/jinja2
+JINJA2_FIRST = sorted(
+    settings.TEMPLATES, key=lambda engine: engine.get('NAME') != 'jinja2'
+)
+
+
+@skipUnless(find_spec('jinja2'), 'не установлен jinja2')
+@override_settings(TEMPLATES=JINJA2_FIRST)
+class JinjaTemplatesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='jinja_author',
+                                            first_name='Иван')
+        cls.group = Group.objects.create(title='Шаблоны', slug='templates')
+        cls.post = Post.objects.create(
+            text='Пост из шаблона Jinja2', author=cls.user, group=cls.group
+        )
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+
+    def setUp(self):
+        # Карточки и ленты в кеше могли остаться от шаблонов Django
+        cache.clear()
+
+    def test_pages_render(self):
+        """Страницы posts рендерятся шаблонами Jinja2 с теми же ссылками"""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:groups'),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:search') + '?q=jinja2',
+            reverse('posts:follow_index'),
+            reverse('posts:post_create'),
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTemplateNotUsed(response, 'base.html')
+                self.assertContains(response, reverse('posts:groups'))
+                self.assertContains(response, 'Пользователь: jinja_author')
+                self.assertNotContains(response, '{{')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.text)
+        self.assertContains(response, reverse(
+            'posts:post_detail', args=(self.post.pk,)
+        ))
+        self.assertContains(response, reverse(
+            'posts:profile', args=(self.user.username,)
+        ))
+
+    def test_forms_use_filters_and_csrf(self):
+        """addclass и csrf_input работают в формах Jinja2"""
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+        self.assertContains(response, 'class="form-control"')
+        response = self.authorized_client.post(
+            reverse('posts:post_create'), {}
+        )
+        self.assertContains(response, 'class="form-control"', count=3)
+        self.assertContains(response, 'errorlist')
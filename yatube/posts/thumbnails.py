@@ -0,0 +1,173 @@
+"""Заблаговременная генерация миниатюр картинок постов.
+
+sorl создает миниатюру при первом рендере страницы, и за декодирование
+и сжатие картинки платит первый посетитель. Здесь все размеры, которые
+используют шаблоны, создаются в пуле потоков сразу после сохранения
+поста, а заодно прогревается key-value хранилище sorl.
+
+Тег {% thumbnail %} ищет каждую миниатюру в хранилище отдельно: чтение
+из кеша и при промахе запрос к thumbnail_kvstore. Для ленты resolve
+находит миниатюры всех постов страницы одним get_many и одним запросом.
+Недостающие миниатюры запрос не создает: они ставятся в очередь, а
+страница до их появления показывает оригинал картинки.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import cards, page_cache
+
+logger = logging.getLogger(__name__)
+
+# Все размеры картинки поста, которые используются в шаблонах.
+# Карточки и страница поста получают миниатюры готовыми через resolve.
+# Карточка в лентах
+CARD = ('960x339', {'crop': 'center', 'upscale': True})
+# Страница поста: картинка целиком
+DETAIL = ('960', {})
+RENDITIONS = (CARD, DETAIL)
+
+_executor = None
+# Картинки, миниатюры которых уже создаются в пуле
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def generate(name):
+    """Создать все миниатюры для картинки с именем name в хранилище"""
+    try:
+        for geometry, options in RENDITIONS:
+            get_thumbnail(name, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        return False
+    return True
+
+
+def refresh(post):
+    """Сбросить карточку и страницы поста.
+
+    Пока миниатюр не было, они показывали оригинал картинки.
+    """
+    cards.bump('post', post.pk)
+    page_cache.invalidate(
+        page_cache.post_scopes(post.author_id, post.group_id)
+        | {page_cache.post_scope(post.pk)}
+    )
+
+
+def generate_in_worker(post):
+    """generate для запуска в отдельном потоке"""
+    name = post.image.name
+    try:
+        created = generate(name)
+        if created:
+            refresh(post)
+        return created
+    finally:
+        with _pending_lock:
+            _pending.discard(name)
+        # Поток пула не проходит через цикл запроса,
+        # поэтому соединения с базой закрываем сами
+        connections.close_all()
+
+
+def submit(post):
+    """Отправить картинку поста в пул, если она еще не в очереди"""
+    with _pending_lock:
+        if post.image.name in _pending:
+            return None
+        _pending.add(post.image.name)
+    return get_executor().submit(generate_in_worker, post)
+
+
+def schedule(post):
+    """Поставить генерацию миниатюр в очередь после коммита транзакции"""
+    if post.image:
+        transaction.on_commit(lambda: submit(post))
+
+
+def thumbnail_name(source, geometry, options):
+    """Имя файла миниатюры, как его вычисляет get_thumbnail sorl.
+
+    Повторяет закрытые методы бэкенда sorl, поэтому версия sorl
+    закреплена в requirements.txt, а совпадение с get_thumbnail
+    проверяет тест.
+    """
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(source, geometry, options)
+
+
+def _get_many(keys):
+    """Записи key-value хранилища sorl: кеш, затем один запрос к базе"""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, KVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if values.get(key) is None]
+    if missing:
+        stored = dict(
+            KVStoreModel.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        kvstore.cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return values
+
+
+def resolve(files, geometry, options):
+    """Миниатюры картинок одного размера: имя картинки -> ImageFile.
+
+    Уже созданные миниатюры берутся из хранилища разом. Для остальных
+    значение None, а картинка ставится в очередь на генерацию: запрос
+    не платит за декодирование и сжатие. У ImageFile есть url, width
+    и height.
+    """
+    keys = {}
+    for file in files:
+        if not file:
+            continue
+        thumbnail = ImageFile(
+            thumbnail_name(ImageFile(file), geometry, options),
+            default.storage,
+        )
+        keys[add_prefix(thumbnail.key)] = file
+    values = _get_many(list(keys))
+    images = {}
+    for key, file in keys.items():
+        value = values.get(key)
+        if value is not None and value != EMPTY_VALUE:
+            images[file.name] = deserialize_image_file(value)
+        else:
+            images[file.name] = None
+            schedule(file.instance)
+    return images
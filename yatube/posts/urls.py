@@ -1,14 +1,21 @@
 from django.urls import path
 
-from . import views
+from . import api, events, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('search/', views.search, name='search'),
+    path('group/', views.groups, name='groups'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<str:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.comments,
+        name='comments'
+    ),
     path('create/', views.post_create, name='post_create'),
     path('posts/<str:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
@@ -27,4 +34,11 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('api/posts/', api.posts_list, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post'),
+    path('api/feed/', api.feed_list, name='api_feed'),
+    path('api/groups/', api.groups_list, name='api_groups'),
+    path('api/export/<str:kind>.ndjson', api.export, name='api_export'),
+    path('events/', events.stream, name='events'),
+    path('events/poll/', events.poll, name='events_poll'),
 ]
@@ -1,99 +1,268 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.functional import SimpleLazyObject
+
+from core.queries import query_budget
+from core.sqlite import retry_on_locked
 
+from . import follow_graph, page_cache
+from . import search as search_index
+from . import thumbnails
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .support_def import paginator
+from .models import (Comment, FeedEntry, Follow, Group, GroupStats, Post,
+                     User)
+from .support_def import (AMT_COMMENTS, AMT_POSTS, CursorPaginator,
+                          OffsetPaginator, paginator)
+
+
+def page_object(request, queryset, **lookup):
+    """Объект страницы: один запрос и для валидаторов, и для вьюхи"""
+    if not hasattr(request, '_page_object'):
+        request._page_object = get_object_or_404(queryset, **lookup)
+    return request._page_object
+
+
+def post_form(request, instance=None):
+    """Форма поста для создания и редактирования вместе с картинкой"""
+    bound = request.method == 'POST'
+    return PostForm(
+        request.POST if bound else None,
+        files=request.FILES if bound else None,
+        instance=instance,
+        rejected_uploads=getattr(request, 'rejected_uploads', ()),
+    )
+
+
+@retry_on_locked()
+def save_post(post, is_new=False):
+    """Запись поста, которая повторяется, если база занята.
+
+    Картинка пишется в хранилище при первой попытке, после этого
+    FieldFile считается сохраненным, и повтор пишет только строку.
+    """
+    if is_new:
+        # id откаченной попытки мог уже занять другой писатель
+        post.pk = None
+    post.save()
+
 
+def index_scopes(request):
+    return [page_cache.index_scope()]
 
+
+def group_scopes(request, slug):
+    try:
+        group = page_object(request, Group, slug=slug)
+    except Http404:
+        return None
+    return [page_cache.group_scope(group.pk)]
+
+
+def profile_scopes(request, username):
+    try:
+        author = page_object(
+            request, User.objects.select_related('stats'), username=username
+        )
+    except Http404:
+        return None
+    return [
+        page_cache.profile_scope(author.pk),
+        page_cache.follows_scope(author.pk),
+    ]
+
+
+def post_scopes(request, post_id):
+    """Сам пост, его группа и автор со счетчиком постов"""
+    if not post_id.isdigit():
+        return None
+    try:
+        post = page_object(
+            request, Post.objects.select_related('author__stats', 'group'),
+            id=post_id,
+        )
+    except Http404:
+        return None
+    scopes = [page_cache.post_scope(post.pk),
+              page_cache.profile_scope(post.author_id)]
+    if post.group_id:
+        scopes.append(page_cache.group_scope(post.group_id))
+    return scopes
+
+
+@query_budget(5)
+@page_cache.conditional(index_scopes)
 def index(request):
     """Обработчик главной страницы"""
-    posts = Post.objects.select_related('group')
-    page_obj = paginator(request, posts)
+    posts = Post.objects.select_related('author', 'group')
+    # Посты запрашиваются, только если ленты нет в кеше
+    page_obj = SimpleLazyObject(lambda: paginator(request, posts))
     template = 'posts/index.html'
     context = {
         'page_obj': page_obj,
+        'feed': page_cache.feed_html(
+            request, 'index', [page_cache.index_scope()], page_obj
+        ),
     }
     return render(request, template, context)
 
 
+@query_budget(6)
+@page_cache.conditional(group_scopes)
 def group_posts(request, slug):
     """Обработчик страницы подробной информации о группе"""
-    group = get_object_or_404(Group, slug=slug)
+    group = page_object(request, Group, slug=slug)
     template = 'posts/group_list.html'
-    posts = group.posts.select_related('group')
-    page_obj = paginator(request, posts)
+    # group.posts сам проставляет post.group, соединение не нужно
+    posts = group.posts.select_related('author')
+    page_obj = SimpleLazyObject(lambda: paginator(request, posts))
     context = {
         'page_obj': page_obj,
         'group': group,
+        'feed': page_cache.feed_html(
+            request, 'group_posts', [page_cache.group_scope(group.pk)],
+            page_obj,
+        ),
     }
     return render(request, template, context)
 
 
+@query_budget(3)
+def groups(request):
+    """Каталог групп с числом постов и последним постом"""
+    template = 'posts/groups.html'
+    stats = GroupStats.objects.select_related('group').order_by(
+        F('last_post_date').desc(nulls_last=True), 'group__title'
+    )
+    return render(request, template, {'stats': stats})
+
+
+@query_budget(7)
+@page_cache.conditional(profile_scopes)
 def profile(request, username):
     """Обработчик страницы подробной информации автора"""
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    if request.user.is_authenticated and author.following.filter(
-        user=request.user
-    ).exists():
-        following = True
-    else:
-        following = False
-    posts = author.posts.select_related('author')
-    page_obj = paginator(request, posts)
+    author = page_object(
+        request, User.objects.select_related('stats'), username=username
+    )
+    following = request.user.is_authenticated and follow_graph.is_following(
+        request.user.pk, author.pk
+    )
+    posts = author.posts.select_related('author', 'group')
+    page_obj = SimpleLazyObject(lambda: paginator(request, posts))
     context = {
         'page_obj': page_obj,
         'author': author,
         'following': following,
+        'feed': page_cache.feed_html(
+            request, 'profile', [page_cache.profile_scope(author.pk)],
+            page_obj, 'posts/includes/profile_post_item.html', '',
+        ),
     }
     return render(request, template, context)
 
 
+@query_budget(5)
+def search(request):
+    """Поиск по текстам постов, группам и авторам"""
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    page_obj = OffsetPaginator(
+        search_index.search(query), AMT_POSTS
+    ).get_page(request.GET.get('page'))
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        page_obj.object_list
+    )
+    page_obj.object_list = [
+        posts[pk] for pk in page_obj.object_list if pk in posts
+    ]
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'extra_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, template, context)
+
+
+@query_budget(5)
+@page_cache.conditional(post_scopes)
 def post_detail(request, post_id):
     """Обработчик страницы подробной информации поста"""
     template = 'posts/post_detail.html'
-    post = Post.objects.get(id=post_id)
-    comments = post.comments.select_related('post')
+    post = page_object(
+        request, Post.objects.select_related('author__stats', 'group'),
+        id=post_id,
+    )
+    # Первая страница комментариев, остальные подгружает comments
+    comments = CursorPaginator(
+        post.comments.select_related('author'), AMT_COMMENTS,
+        keys=('created', 'id'), descending=False,
+    ).first_page()
     form = CommentForm()
+    image = None
+    if post.image:
+        image = thumbnails.resolve(
+            [post.image], *thumbnails.DETAIL
+        )[post.image.name]
     context = {
         'post': post,
         'comments': comments,
         'form': form,
+        'image': image,
     }
     return render(request, template, context)
 
 
+@query_budget(1)
+def comments(request, post_id):
+    """Следующая страница комментариев поста html-фрагментом"""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    )
+    context = {
+        'comments': paginator(request, comments, keys=('created', 'id'),
+                              descending=False, per_page=AMT_COMMENTS,
+                              legacy_pages=False),
+        'post_id': post_id,
+    }
+    return render(request, 'posts/includes/comments_page.html', context)
+
+
 @login_required
+@query_budget(12)
 def post_create(request):
     """Обработчик страницы создания поста"""
     template = 'posts/post_create.html'
-    if request.method == 'POST':
-        form = PostForm(request.POST)
-        if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-            form.save()
-            return redirect('posts:profile', post.author)
-        return render(request, template, {'form': form})
-    form = PostForm()
+    form = post_form(request)
+    if form.is_valid():
+        post = form.save(commit=False)
+        post.author = request.user
+        save_post(post, is_new=True)
+        thumbnails.schedule(post)
+        return redirect('posts:profile', post.author)
     return render(request, template, {'form': form})
 
 
 @login_required
+@query_budget(7)
 def post_edit(request, post_id):
     """Обработчик страницы редактирования поста"""
     template = 'posts/post_create.html'
-    post_data = get_object_or_404(Post, id=post_id)
+    post_data = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
     if request.user != post_data.author:
         return redirect('posts:post_detail', post_id)
-    form = PostForm(
-        request.POST or None,
-        files=request.FILES or None,
-        instance=post_data
-    )
+    form = post_form(request, instance=post_data)
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        save_post(post)
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -104,6 +273,8 @@ def post_edit(request, post_id):
 
 
 @login_required
+@query_budget(5)
+@retry_on_locked()
 def add_comment(request, post_id):
     """Блок добавления комментария"""
     post = get_object_or_404(Post, id=post_id)
@@ -117,12 +288,13 @@ def add_comment(request, post_id):
 
 
 @login_required
+@query_budget(5)
 def follow_index(request):
     """Страница с постами избранных авторов"""
-    user = request.user  # текущий юзер
-    posts = Post.objects.filter(
-        author__following__user=user).select_related('author', 'group')
-    page_obj = paginator(request, posts)
+    entries = FeedEntry.objects.filter(
+        user=request.user).select_related('post__author', 'post__group')
+    page_obj = paginator(request, entries, keys=('pub_date', 'post_id'))
+    page_obj.object_list = [entry.post for entry in page_obj.object_list]
     template = 'posts/follow.html'
     context = {
         'page_obj': page_obj,
@@ -131,21 +303,31 @@ def follow_index(request):
 
 
 @login_required
+@query_budget(10)
 def profile_follow(request, username):
     """Подписка на автора"""
     author = get_object_or_404(User, username=username)
-    if request.user != author and not Follow.objects.filter(
-        user=request.user, author=author
-    ).exists():
-        Follow.objects.create(user=request.user, author=author)
-        return redirect('posts:profile', username)
-    else:
-        return redirect('posts:profile', username)
+    if request.user != author and not follow_graph.is_following(
+        request.user.pk, author.pk
+    ):
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=request.user, author=author)
+        except IntegrityError:
+            # Подписка уже была, а граф в кеше отстал
+            follow_graph.add(request.user.pk, author.pk)
+    return redirect('posts:profile', username)
 
 
 @login_required
+@query_budget(8)
 def profile_unfollow(request, username):
     """Отписка от автора"""
     author = get_object_or_404(User, username=username)
-    Follow.objects.get(user=request.user, author=author).delete()
+    deleted, _ = Follow.objects.filter(
+        user=request.user, author=author
+    ).delete()
+    if not deleted:
+        # Подписки не было, а граф в кеше мог считать иначе
+        follow_graph.remove(request.user.pk, author.pk)
     return redirect('posts:profile', username)
@@ -0,0 +1,53 @@
+// Уведомления о новых постах и комментариях без перезагрузки страницы:
+// Server-Sent Events, а в браузерах без EventSource - long-poll.
+// Если сервер не держит соединения (data-events-interval), страница
+// опрашивает poll раз в заданное число секунд
+(function () {
+  var box = document.querySelector('[data-events-poll]');
+  if (!box) {
+    return;
+  }
+  var count = 0;
+  var interval = Number(box.dataset.eventsInterval || 0) * 1000;
+
+  function show() {
+    count += 1;
+    box.textContent = box.dataset.eventsLabel + ': ' + count +
+      '. Обновить страницу';
+    box.hidden = false;
+  }
+
+  if (box.dataset.events && window.EventSource) {
+    var source = new EventSource(box.dataset.events);
+    source.addEventListener('post', show);
+    source.addEventListener('comment', show);
+    return;
+  }
+
+  var last = '';
+
+  function poll() {
+    var url = box.dataset.eventsPoll + (last ? '&last=' + last : '');
+    fetch(url, {credentials: 'same-origin'})
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status);
+        }
+        return response.json();
+      })
+      .then(function (data) {
+        last = data.last;
+        data.events.forEach(show);
+        if (interval) {
+          setTimeout(poll, interval);
+        } else {
+          poll();
+        }
+      })
+      .catch(function () {
+        setTimeout(poll, Math.max(interval, 5000));
+      });
+  }
+
+  poll();
+})();
@@ -0,0 +1,32 @@
+"""
+ASGI config for yatube project.
+
+Django 2.2 has no ASGI handler of its own. Event streams are served by
+the coroutines in posts.asgi, every other request runs the regular WSGI
+application in a thread pool. Run it with any ASGI server, e.g.:
+
+    uvicorn yatube.asgi:application
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+# Ожидание событий здесь не занимает потоков, страницы могут его включать
+os.environ.setdefault('YATUBE_EVENTS_STREAMING', '1')
+
+# get_wsgi_application настраивает Django, поэтому импорты ниже
+wsgi_application = get_wsgi_application()
+
+from core.asgi import Router, WsgiApplication  # noqa: E402
+from posts import asgi as posts_asgi  # noqa: E402
+
+application = Router(
+    {
+        reverse('posts:events'): posts_asgi.stream,
+        reverse('posts:events_poll'): posts_asgi.poll,
+    },
+    WsgiApplication(wsgi_application),
+)
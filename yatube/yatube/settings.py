@@ -9,8 +9,11 @@ https://docs.djangoproject.com/en/2.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
+import importlib.util
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -51,34 +54,72 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PrecompressedStaticMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.QueryCountMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
 
+TEMPLATE_CONTEXT_PROCESSORS = [
+    'django.template.context_processors.debug',
+    'django.template.context_processors.request',
+    'django.contrib.auth.context_processors.auth',
+    'django.contrib.messages.context_processors.messages',
+    'core.context_processors.year.year',
+    'core.context_processors.events.events',
+]
+
 TEMPLATES = [
     {
+        'NAME': 'django',
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
+        # Без явных loaders Django оборачивает их в cached.Loader, только
+        # когда DEBUG выключен: в бою скомпилированные шаблоны хранятся
+        # в памяти процесса, при разработке правки видны без перезапуска
         'APP_DIRS': True,
         'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-                'core.context_processors.year.year',
-            ],
+            'context_processors': TEMPLATE_CONTEXT_PROCESSORS,
         },
     },
 ]
 
+# Шаблоны posts на Jinja2 лежат в posts/jinja2. Движок подключается,
+# если установлен пакет jinja2; YATUBE_TEMPLATE_ENGINE=jinja2 ставит его
+# первым, и страницы posts рендерятся им. Остальные приложения
+# по-прежнему находят свои шаблоны в движке Django.
+TEMPLATE_ENGINE = os.environ.get('YATUBE_TEMPLATE_ENGINE', 'django')
+
+if TEMPLATE_ENGINE == 'jinja2' and not importlib.util.find_spec('jinja2'):
+    raise ImproperlyConfigured(
+        'YATUBE_TEMPLATE_ENGINE=jinja2, но пакет jinja2 не установлен'
+    )
+
+if importlib.util.find_spec('jinja2'):
+    JINJA2_TEMPLATES = {
+        'NAME': 'jinja2',
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'core.jinja.environment',
+            'context_processors': TEMPLATE_CONTEXT_PROCESSORS,
+        },
+    }
+    if TEMPLATE_ENGINE == 'jinja2':
+        TEMPLATES.insert(0, JINJA2_TEMPLATES)
+    else:
+        TEMPLATES.append(JINJA2_TEMPLATES)
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -89,8 +130,48 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Постоянные соединения: PRAGMA выполняются один раз на соединение
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 60)),
+        # Сколько секунд sqlite3 ждет блокировку до "database is locked"
+        'OPTIONS': {'timeout': 5},
     }
 }
+# Дополнения и замены к core.sqlite.DEFAULT_PRAGMAS, например
+# {'synchronous': 'FULL'}. Применяются к каждому новому соединению
+SQLITE_PRAGMAS = {}
+
+# Реплики для чтения: пути к файлам SQLite через запятую. Локально их
+# наполняет команда sync_replicas копированием основной базы.
+# Тесты запускаются без реплик: TestCase разрешает только запросы к default
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')), 1
+):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        # В тестах реплики смотрят в тестовую основную базу
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Сколько секунд после записи клиент читает только основную базу
+REPLICA_STICKY_SECONDS = int(os.environ.get('YATUBE_REPLICA_STICKY', 10))
+
+# Превышение бюджета запросов вьюхи (core.queries.query_budget) - ошибка,
+# а не запись в лог. В тестах строгий режим включает TestRunner
+QUERY_BUDGET_STRICT = DEBUG
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Ответы меньше этого размера в байтах не сжимаются: выигрыш не окупает
+# заголовки и время. Сжатые тела страниц с ETag хранятся в кеше
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_CACHE_TIMEOUT = 60 * 10
+
+# max-age для страниц анонимным читателям. При 0 прокси хранят страницу,
+# но каждый раз проверяют ее по ETag
+ANONYMOUS_CACHE_SECONDS = int(os.environ.get('YATUBE_ANONYMOUS_CACHE', 30))
 
 
 # Password validation
@@ -131,6 +212,15 @@ USE_TZ = True
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# Боевой режим статики: collectstatic добавляет хеш содержимого в имена
+# и сжатые копии .gz/.br, а PrecompressedStaticMiddleware отдает их с
+# бессрочным кешированием. Перед запуском нужен collectstatic
+STATIC_PRECOMPRESSED = os.environ.get('YATUBE_STATIC_PRECOMPRESSED') == '1'
+if STATIC_PRECOMPRESSED:
+    STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+# Кеширование статики без хеша в имени, в секундах
+STATIC_MAX_AGE = 60
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -150,6 +240,22 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Загрузки больше мегабайта пишутся во временный файл, а не в память.
+# Файлы больше UPLOAD_MAX_SIZE отбрасываются во время загрузки
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+UPLOAD_MAX_SIZE = int(
+    os.environ.get('YATUBE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+)
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Картинки постов пережимаются при загрузке: JPEG или WEBP (если его
+# поддерживает установленный Pillow) не больше POST_IMAGE_MAX_SIZE
+POST_IMAGE_FORMAT = os.environ.get('YATUBE_POST_IMAGE_FORMAT', 'JPEG')
+POST_IMAGE_MAX_SIZE = 1920
+
 # Подключаем бэкэнд кеширование.
 # Этот бэкенд годится для разработки, а на боевом сервере обычно используют Memcached или Redis.
 CACHES = {
@@ -157,3 +263,14 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Уведомления о новых постах и комментариях (posts.events).
+# Поток событий и ожидающий long-poll держат соединение открытым, а под
+# WSGI вместе с ним и поток сервера. Поэтому они включены только в
+# yatube.asgi, которое ставит YATUBE_EVENTS_STREAMING=1; под WSGI
+# страницы опрашивают poll раз в EVENTS_POLL_INTERVAL секунд
+EVENTS_STREAMING = os.environ.get('YATUBE_EVENTS_STREAMING') == '1'
+EVENTS_POLL_INTERVAL = 30
+EVENTS_POLL_TIMEOUT = 25
+EVENTS_HEARTBEAT = 15
+EVENTS_STREAM_SECONDS = 60